@@ -1,6 +1,12 @@
+import sublime
 import sublime_plugin
 
+from .impl import memory
 from .impl import op
+from .impl import profiling
+from .impl import recorder
+from .impl import ruler_index
+from .impl import watchdog
 from .impl.edit import *
 from .impl.listener import *
 from .impl.shared import cxt
@@ -20,6 +26,85 @@ class AutosplitJoin(sublime_plugin.TextCommand):
             op.join_all_at(edit, [at] if at else [reg.b for reg in self.view.sel()])
 
 
+class AutosplitJoinToFit(sublime_plugin.TextCommand):
+    def run(self, edit, at=None):
+        with cxt.working_on(self.view):
+            op.erase_joinable_arrows()
+            op.join_to_fit_all_at(edit, [at] if at else [reg.b for reg in self.view.sel()])
+
+
+class AutosplitGotoViolation(sublime_plugin.TextCommand):
+    """Move the cursor to the next (or previous) line that surpasses the ruler"""
+
+    def run(self, edit, forward=True):
+        with cxt.working_on(self.view):
+            if cxt.ruler is None:
+                return
+
+            index = ruler_index.index_for(self.view)
+            row, col = self.view.rowcol(self.view.sel()[0].b)
+            if forward:
+                row = index.next_violation(row, cxt.ruler)
+            else:
+                row = index.prev_violation(row, cxt.ruler)
+
+            if row is None:
+                sublime.status_message("AutoSplit: no more lines past the ruler")
+                return
+
+            pos = self.view.text_point(row, cxt.ruler)
+            self.view.sel().clear()
+            self.view.sel().add(pos)
+            self.view.show(pos)
+
+
+class AutosplitRestoreFeatures(sublime_plugin.TextCommand):
+    def run(self, edit):
+        watchdog.restore(self.view)
+
+
+class AutosplitToggleRecording(sublime_plugin.TextCommand):
+    """Start or stop recording the editing session in this view, for replay.py"""
+
+    def run(self, edit):
+        if recorder.recorder_for(self.view) is None:
+            path = recorder.start(self.view)
+            sublime.status_message("AutoSplit: recording to {}".format(path))
+        else:
+            path = recorder.stop(self.view)
+            sublime.status_message("AutoSplit: recorded {}".format(path))
+
+
+class AutosplitProfile(sublime_plugin.WindowCommand):
+    """Profile the next invocations of AutoSplit commands and listeners.
+
+    Running it again during a capture ends the capture early.
+    """
+
+    def run(self, invocations=50):
+        if profiling.is_capturing():
+            profiling.finish()
+            return
+
+        targets = [
+            klass for klass in globals().values()
+            if isinstance(klass, type) and issubclass(klass, sublime_plugin.TextCommand)
+        ]
+        profiling.start(self.window, invocations, targets + [Listener])
+        sublime.status_message(
+            "AutoSplit: profiling the next {} invocations".format(invocations)
+        )
+
+
+class AutosplitMemoryUsage(sublime_plugin.WindowCommand):
+    """Show the memory held by AutoSplit's caches and state in an output panel"""
+
+    def run(self):
+        panel = self.window.create_output_panel('autosplit_memory')
+        panel.run_command('append', {'characters': memory.report()})
+        self.window.run_command('show_panel', {'panel': 'output.autosplit_memory'})
+
+
 class AutosplitRunTests(sublime_plugin.WindowCommand):
     def run(self):
         import sys
@@ -30,3 +115,15 @@ class AutosplitRunTests(sublime_plugin.WindowCommand):
             run_tests(self.window)
         finally:
             sys.modules.pop('AutoSplit.impl.tests', None)
+
+
+class AutosplitRunBenchmarks(sublime_plugin.WindowCommand):
+    def run(self, repeats=10):
+        import sys
+        sys.modules.pop('AutoSplit.impl.benchmarks', None)
+
+        try:
+            from .impl.benchmarks import run_benchmarks
+            run_benchmarks(self.window, repeats)
+        finally:
+            sys.modules.pop('AutoSplit.impl.benchmarks', None)
@@ -0,0 +1,299 @@
+"""Per-buffer index of all the arglists of large files, persisted across sessions.
+
+In a huge file (e.g. a generated one), parsing an arglist means scanning all of its
+tokens, one API call each. The index holds the positions of the parens of every
+arglist and of its commas, found with three find_by_selector() calls, so that the
+parser can build arglists without scanning (see parse.py). It's built by a
+background job and the async thread, and is only used while the buffer is in the state
+it was built for.
+
+Whole-file passes (format on save, the batch formatter) don't build an index: they edit
+the text as they go, and the first edit would make it stale. They parse by scanning
+tokens like the commands do; the batch formatter's chunks are below MIN_SIZE anyway.
+
+Indices of files that are saved are written to the cache folder, and reused when the
+file is opened again if its size and content hash (and the editor version, which
+determines the syntax) match. Nested arrays are stored in CSR layout: the commas of
+arglist i are commas[comma_starts[i]:comma_starts[i + 1]], the same for children.
+"""
+import hashlib
+import os
+import struct
+import sublime
+import sys
+
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+from itertools import chain
+from itertools import repeat
+
+from .shared import Scope
+
+
+MIN_SIZE = 1 << 20  # smaller files are parsed fast enough by scanning tokens
+MAGIC = b'ASAI1\n'
+DIGEST_SIZE = 16
+HASH_CHUNK = 1 << 20  # chars of the text hashed per step
+
+INCOMPLETE = -1  # close of an arglist whose closing paren is missing
+NO_ARGLIST = -1  # result of innermost() when no arglist encloses the range
+
+OPEN, CLOSE, COMMA = range(3)
+
+
+class ArglistIndex:
+    """All arglists of a text, in order of their opening parens"""
+
+    def __init__(self, opens, closes, parents, comma_starts, commas, child_starts,
+                 children):
+        self.opens = opens  # after opening paren
+        self.closes = closes  # before closing paren, or INCOMPLETE
+        self.parents = parents  # index of the enclosing arglist, or -1
+        self.comma_starts = comma_starts
+        self.commas = commas
+        self.child_starts = child_starts
+        self.children = children
+        self.change_count = None  # of the buffer state the index is valid for
+
+    def arrays(self):
+        return [self.opens, self.closes, self.parents, self.comma_starts, self.commas,
+                self.child_starts, self.children]
+
+    def innermost(self, begin, end):
+        """Innermost arglist i with opens[i] <= begin and end <= closes[i].
+
+        Return NO_ARGLIST if there's none, or None if it can't be told, because an
+        arglist missing its closing paren may enclose the range.
+        """
+        i = bisect_right(self.opens, begin) - 1
+        while i >= 0:
+            if self.closes[i] == INCOMPLETE:
+                return None
+            if end <= self.closes[i]:
+                return i
+            i = self.parents[i]
+
+        return NO_ARGLIST
+
+    def commas_of(self, i):
+        return self.commas[self.comma_starts[i]:self.comma_starts[i + 1]]
+
+    def children_of(self, i):
+        return self.children[self.child_starts[i]:self.child_starts[i + 1]]
+
+
+def find_positions(view):
+    """Generate steps finding the positions of parens and commas; return them when done"""
+    positions = []
+    for selector in (Scope.open_paren, Scope.close_paren, Scope.comma):
+        # Adjacent parens come merged into one region
+        positions.append([
+            pos for reg in view.find_by_selector(selector)
+            for pos in range(reg.begin(), reg.end())
+        ])
+        yield
+
+    return positions
+
+
+def structure(open_posns, close_posns, comma_posns):
+    """Index of the arglists delimited by the given paren and comma positions.
+
+    The bulk work is done by builtins: events are merged by sorting them as ints, and
+    grouped into CSR arrays by counting and sorting. Only the matching of parens is a
+    Python loop, and a tight one. It runs on the async thread (see ensure_index), so it
+    has no steps to yield at.
+    """
+    # Events in text order, encoded as pos * 4 + kind
+    events = sorted(chain(
+        [pos * 4 + OPEN for pos in open_posns],
+        [pos * 4 + CLOSE for pos in close_posns],
+        [pos * 4 + COMMA for pos in comma_posns],
+    ))
+
+    opens, closes, parents = [], [], []
+    comma_owners, commas = [], []
+    stack = []
+    top = -1  # arglist being in, or -1
+
+    for event in events:
+        kind = event & 3
+        if kind == OPEN:
+            parents.append(top)
+            top = len(opens)
+            stack.append(top)
+            opens.append((event >> 2) + 1)
+            closes.append(INCOMPLETE)
+        elif top < 0:
+            pass  # stray closing paren or comma
+        elif kind == CLOSE:
+            closes[stack.pop()] = event >> 2
+            top = stack[-1] if stack else -1
+        else:
+            comma_owners.append(top)
+            commas.append(event >> 2)
+
+    n = len(opens)
+    comma_starts, commas = group(n, comma_owners, commas)
+    child_starts, children = group(n, parents, range(n))
+    return ArglistIndex(
+        array('i', opens), array('i', closes), array('i', parents),
+        comma_starts, commas, child_starts, children
+    )
+
+
+def group(n, owners, values):
+    """CSR layout of values by owner (-1 for none), values of each owner in order"""
+    counts = Counter(owners)
+    starts = array('i', accumulate(chain([0], map(counts.get, range(n), repeat(0)))))
+    order = sorted(range(len(owners)), key=owners.__getitem__)  # stable
+    values = array('i', map(values.__getitem__, order[counts.get(-1, 0):]))
+    return starts, values
+
+
+def text_digest(view):
+    """Generate steps hashing the view's text; return the digest when done"""
+    h = hashlib.sha1()
+    for begin in range(0, view.size(), HASH_CHUNK):
+        h.update(view.substr(sublime.Region(begin, begin + HASH_CHUNK)).encode('utf-8'))
+        yield
+
+    return h.digest()[:DIGEST_SIZE]
+
+
+## On-disk format: MAGIC, header (text size, text digest, lengths of the editor
+## version and of the file path), the version and path, then each array preceded by
+## its length. Arrays are little-endian.
+HEADER = struct.Struct('<Q{}sII'.format(DIGEST_SIZE))
+LENGTH = struct.Struct('<Q')
+
+
+def index_path(file_name):
+    key = hashlib.sha1(file_name.encode('utf-8')).hexdigest()
+    return os.path.join(sublime.cache_path(), 'AutoSplit', 'arglist-index', key + '.bin')
+
+
+def save(index, file_name, size, digest):
+    path = index_path(file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    version = sublime.version().encode()
+    name = file_name.encode('utf-8')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER.pack(size, digest, len(version), len(name)))
+        f.write(version)
+        f.write(name)
+        for arr in index.arrays():
+            f.write(LENGTH.pack(len(arr)))
+            f.write(little_endian(arr).tobytes())
+
+    os.replace(tmp_path, path)
+
+
+def load(file_name, size):
+    """Read the saved index of file_name, return (index, digest) or None.
+
+    None is returned if there's no index, or it's for a different file, text size or
+    editor version. The caller must check the digest against the text.
+    """
+    try:
+        with open(index_path(file_name), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    if not data.startswith(MAGIC):
+        return None
+
+    try:
+        pos = len(MAGIC)
+        stored_size, digest, version_len, name_len = HEADER.unpack_from(data, pos)
+        pos += HEADER.size
+        version = data[pos:pos + version_len].decode()
+        pos += version_len
+        name = data[pos:pos + name_len].decode('utf-8')
+        pos += name_len
+
+        if (stored_size, version, name) != (size, sublime.version(), file_name):
+            return None
+
+        arrays = []
+        for i in range(7):
+            [length] = LENGTH.unpack_from(data, pos)
+            pos += LENGTH.size
+            arr = array('i')
+            arr.frombytes(data[pos:pos + length * arr.itemsize])
+            pos += length * arr.itemsize
+            arrays.append(little_endian(arr))
+    except (struct.error, ValueError, UnicodeDecodeError):
+        return None
+
+    return ArglistIndex(*arrays), digest
+
+
+def little_endian(arr):
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+indices = {}  # view.buffer_id() -> ArglistIndex
+
+
+def fresh_index(view):
+    """The view's index if it is valid for the current text, else None"""
+    index = indices.get(view.buffer_id())
+    if index is not None and index.change_count == view.change_count():
+        return index
+    return None
+
+
+def ensure_index(view):
+    """Job that makes the view's index fresh: loaded from disk if possible, or rebuilt.
+
+    Rebuilding takes a snapshot of the positions of parens and commas; the index is
+    structured from it on the async thread, so that big files don't freeze the UI, and
+    installed back on the UI thread unless the buffer has changed meanwhile.
+    """
+    if view.size() < MIN_SIZE or fresh_index(view) is not None:
+        return
+
+    change_count = view.change_count()
+    size = view.size()
+    file_name = view.file_name()
+    # Only the index of the text as saved in the file is worth persisting
+    persistent = file_name is not None and not view.is_dirty()
+
+    saved = digest = None
+    if persistent:
+        saved = load(file_name, size)
+        digest = yield from text_digest(view)
+
+    if saved is not None and saved[1] == digest:
+        install(view, saved[0], change_count)
+        return
+
+    positions = yield from find_positions(view)
+
+    def build():
+        index = structure(*positions)
+        if persistent:
+            save(index, file_name, size, digest)
+        sublime.set_timeout(lambda: install(view, index, change_count))
+
+    sublime.set_timeout_async(build)
+
+
+def install(view, index, change_count):
+    if view.is_valid() and view.change_count() == change_count:
+        index.change_count = change_count
+        indices[view.buffer_id()] = index
+
+
+def forget(view):
+    indices.pop(view.buffer_id(), None)
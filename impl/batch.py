@@ -0,0 +1,368 @@
+"""Formatting Python files outside of Sublime Text.
+
+    python -m AutoSplit.impl.batch [--check] [--ruler N] [--tab-size N]
+                                   [--cache FILE | --no-cache] FILE...
+
+Every line of a file is treated as changed and formatted the way format on save does
+it: argument lists that fit are joined, lines past the ruler are split. Files are
+rewritten in place; with --check, they are only reported and the exit status is 1
+if any would change. The engine works with '\\n' line endings: files with '\\r\\n' ones
+are formatted with them turned into '\\n', and written back with '\\r\\n'. Files are
+decoded as their coding cookie says (UTF-8 by default); those that can't be are
+reported as skipped, which --check counts as a failure too.
+
+Files found to be already formatted are remembered in a result cache (see
+result_cache.py), so that later runs skip them without parsing as long as neither
+their content, the options nor the engine change.
+
+Files larger than --stream-threshold-mb are memory-mapped and formatted in chunks of
+whole top-level statements, with the result written out chunk by chunk, so that
+memory use is bounded by the largest statement rather than the file size. Argument
+lists never span statements, so the result is the same.
+
+Other large files are cut into such chunks as well, and the chunks are formatted on
+a pool of --jobs processes. Results are collected in order, so they are identical to
+a sequential run.
+"""
+from . import headless
+
+import argparse
+import codecs
+import io
+import mmap
+import os
+import shutil
+import sublime
+import sys
+import tempfile
+import tokenize
+
+from collections import deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+
+from . import op
+from .edit import call_with_edit
+from .headless.view import View
+from .result_cache import DEFAULT_MAX_ENTRIES
+from .result_cache import ResultCache
+from .result_cache import cache_key
+from .result_cache import cache_key_of_bytes
+from .result_cache import engine_version
+from .shared import cxt
+
+
+def format_text(text, ruler, tab_size):
+    """Return text formatted with the given ruler"""
+    view = View(text, settings={'rulers': [ruler], 'tab_size': tab_size})
+
+    with cxt.working_on(view):
+        nrows = view.rowcol(view.size())[0] + 1
+        call_with_edit(
+            view, lambda edit: op.format_rows(edit, range(nrows), float('inf'))
+        )
+
+    return view.substr(sublime.Region(0, view.size()))
+
+
+DEFAULT_STREAM_THRESHOLD_MB = 16
+# Statements are formatted in chunks of at least this many chars. Chunks are what the
+# pool hands out to processes: that many chars take long enough to format that sending
+# them to a process costs little, and files past CHUNKED_MIN_SIZE still make enough of
+# them to keep the processes busy.
+CHUNK_SIZE = 1 << 14
+
+
+CHUNKED_MIN_SIZE = 4 * CHUNK_SIZE  # smaller files are formatted whole
+IN_FLIGHT_PER_JOB = 4  # chunks submitted to the pool ahead of the one being written
+
+
+class ChunkPool:
+    """Process pool for formatting chunks in parallel, started on first use"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.executor = None
+
+    def format_chunks(self, chunks, ruler, tab_size):
+        """Yield (chunk, formatted chunk) in order, with few chunks in memory at a time"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.jobs)
+
+        window = deque()
+        try:
+            for chunk in chunks:
+                future = self.executor.submit(format_text, chunk, ruler, tab_size)
+                window.append((chunk, future))
+                if len(window) >= self.jobs * IN_FLIGHT_PER_JOB:
+                    chunk, future = window.popleft()
+                    yield chunk, future.result()
+
+            while window:
+                chunk, future = window.popleft()
+                yield chunk, future.result()
+        finally:
+            for chunk, future in window:
+                future.cancel()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def format_chunks(chunks, ruler, tab_size, pool):
+    """Yield (chunk, formatted chunk), in parallel if there's a pool"""
+    if pool is not None:
+        return pool.format_chunks(chunks, ruler, tab_size)
+
+    return ((chunk, format_text(chunk, ruler, tab_size)) for chunk in chunks)
+
+
+def format_file(path, ruler, tab_size, check, cache, version, stream_threshold, pool):
+    """Format the file at path, return whether it needed any changes"""
+    if os.path.getsize(path) > stream_threshold:
+        return format_file_streaming(path, ruler, tab_size, check, cache, version, pool)
+
+    with open(path, 'rb') as f:
+        encoding = source_encoding(f)
+        text = f.read().decode(encoding)
+
+    key = cache_key(text, ruler, tab_size, version)
+    if cache is not None and key in cache:
+        return False
+
+    newline = line_ending(text[:text.find('\n') + 1])
+    text = text.replace('\r\n', '\n')
+
+    if len(text) >= CHUNKED_MIN_SIZE:
+        lines = iter(io.StringIO(text, newline='\n'))
+        formatted = ''.join(
+            formatted for chunk, formatted
+            in format_chunks(statement_chunks(lines), ruler, tab_size, pool)
+        )
+    else:
+        formatted = format_text(text, ruler, tab_size)
+
+    if formatted == text:
+        if cache is not None:
+            cache.add(key)
+        return False
+
+    if not check:
+        with open(path, 'w', encoding=encoding, newline=newline) as f:
+            f.write(formatted)
+
+    return True
+
+
+def format_file_streaming(path, ruler, tab_size, check, cache, version, pool):
+    """Same as format_file, holding no more than a chunk of statements in memory"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        key = cache_key_of_bytes(data, ruler, tab_size, version)
+        if cache is not None and key in cache:
+            return False
+
+        encoding = source_encoding(data)
+        data.seek(0)
+        newline = line_ending(data.readline().decode(encoding))
+        data.seek(0)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        lines = (
+            decoder.decode(line).replace('\r\n', '\n')
+            for line in iter(data.readline, b'')
+        )
+        chunks = format_chunks(statement_chunks(lines), ruler, tab_size, pool)
+
+        if check:
+            changed = any(chunk != formatted for chunk, formatted in chunks)
+        else:
+            changed = write_chunks(path, chunks, encoding, newline)
+
+    if not changed and cache is not None:
+        cache.add(key)
+
+    return changed
+
+
+def write_chunks(path, chunks, encoding, newline):
+    """Write formatted chunks to a file that replaces path if any chunk changed"""
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder)
+    changed = False
+
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding, newline=newline) as f:
+            for chunk, formatted in chunks:
+                changed = changed or chunk != formatted
+                f.write(formatted)
+
+        if changed:
+            shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    return changed
+
+
+def source_encoding(f):
+    """Encoding of the Python source in binary file f, read from its start.
+
+    That's what its coding cookie or BOM says (see PEP 263), UTF-8 by default. A BOM
+    makes it 'utf-8-sig', which drops the BOM from the text and writes it back.
+
+    :raise SyntaxError: if the cookie names an unknown encoding
+    """
+    encoding, lines = tokenize.detect_encoding(f.readline)
+    f.seek(0)
+    return encoding
+
+
+def line_ending(first_line):
+    """Line ending to write a file with: that of its first line"""
+    return '\r\n' if first_line.endswith('\r\n') else '\n'
+
+
+def statement_chunks(lines):
+    """Join lines of Python source into chunks of whole top-level statements.
+
+    A chunk ends before a statement that starts at the top level (column 0) once the
+    chunk has reached CHUNK_SIZE chars. Comments and blank lines go with the
+    statement that follows them. If the source can't be tokenized, the rest of it is
+    cut by paragraph_chunks().
+    """
+    pending = []  # lines read by the tokenizer but not yet put into a chunk
+    first_pending_row = 1
+
+    def readline():
+        line = next(lines, '')
+        if line:
+            pending.append(line)
+        return line
+
+    chunk = []
+    chunk_size = 0
+    depth = 0  # indentation level
+    at_statement_start = False
+
+    try:
+        for token in tokenize.generate_tokens(readline):
+            if token.type == tokenize.INDENT:
+                depth += 1
+            elif token.type == tokenize.DEDENT:
+                depth -= 1
+            elif token.type == tokenize.NEWLINE:
+                at_statement_start = True
+            elif token.type in (tokenize.NL, tokenize.COMMENT, tokenize.ENDMARKER):
+                pass
+            else:
+                if at_statement_start and depth == 0:
+                    # Lines before this one hold complete statements
+                    done = token.start[0] - first_pending_row
+                    chunk.extend(pending[:done])
+                    chunk_size += sum(map(len, pending[:done]))
+                    del pending[:done]
+                    first_pending_row += done
+
+                    if chunk_size >= CHUNK_SIZE:
+                        yield ''.join(chunk)
+                        chunk, chunk_size = [], 0
+
+                at_statement_start = False
+    except (tokenize.TokenError, SyntaxError):
+        if chunk:
+            yield ''.join(chunk)
+        yield from paragraph_chunks(chain(pending, lines))
+        return
+
+    chunk.extend(pending)
+    if chunk:
+        yield ''.join(chunk)
+
+
+def paragraph_chunks(lines):
+    """Join lines into chunks, cutting only before a line at column 0 after a blank one.
+
+    This is for source that can't be tokenized: such lines most likely start top-level
+    statements, and the chunks stay small without knowing where statements are.
+    """
+    chunk = []
+    chunk_size = 0
+    after_blank = False
+
+    for line in lines:
+        if after_blank and line[:1].strip() and chunk_size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, chunk_size = [], 0
+
+        chunk.append(line)
+        chunk_size += len(line)
+        after_blank = not line.strip()
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def default_cache_path():
+    return os.path.join(sublime.cache_path(), 'AutoSplit', 'batch-results.bin')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Format Python files with AutoSplit")
+    parser.add_argument('files', nargs='+', metavar='FILE')
+    parser.add_argument('--check', action='store_true',
+                        help="don't write files, exit with 1 if any would change")
+    parser.add_argument('--ruler', type=int, default=79)
+    parser.add_argument('--tab-size', type=int, default=4)
+    parser.add_argument('--cache', metavar='FILE', default=default_cache_path(),
+                        help="result cache location")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="max number of files remembered as formatted")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--stream-threshold-mb', type=float,
+                        default=DEFAULT_STREAM_THRESHOLD_MB,
+                        help="format larger files in chunks, without reading them whole")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help="processes to format large files with (default: all CPUs)")
+    args = parser.parse_args(argv)
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache, args.cache_size)
+        cache.load()
+
+    version = engine_version()
+    stream_threshold = args.stream_threshold_mb * 1024 * 1024
+    pool = ChunkPool(args.jobs) if args.jobs > 1 else None
+    changed = skipped = 0
+
+    try:
+        for path in args.files:
+            try:
+                if not format_file(path, args.ruler, args.tab_size, args.check, cache,
+                                   version, stream_threshold, pool):
+                    continue
+            except (UnicodeDecodeError, SyntaxError) as e:
+                # SyntaxError is for a coding cookie of an unknown encoding
+                skipped += 1
+                print("skipped {}: {}".format(path, e), file=sys.stderr)
+                continue
+
+            changed += 1
+            print("{} {}".format("would reformat" if args.check else "reformatted", path))
+    finally:
+        if pool is not None:
+            pool.close()
+        if cache is not None:
+            cache.save()
+
+    print("{} of {} files {}{}".format(
+        changed, len(args.files), "would be reformatted" if args.check else "reformatted",
+        ", {} skipped".format(skipped) if skipped else ""
+    ))
+    return 1 if args.check and (changed or skipped) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
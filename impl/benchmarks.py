@@ -0,0 +1,175 @@
+"""Timing AutoSplit inside the editor, where View API calls cross into the plugin host.
+
+Inputs are generated at several sizes in a scratch view. Each operation is run a
+number of times on a fresh copy of its input (so that no cache carries over between
+runs), and the median and best times are reported, along with the per-call cost of
+the View APIs the engine relies on. The table is printed to the console and to an
+output panel, for comparison across machines and versions.
+"""
+import random
+import sublime
+import time
+
+from . import op
+from .edit import call_with_edit
+from .parse_cache import invalidate as invalidate_parse_cache
+from .shared import cxt
+
+
+SIZES = [10, 100, 1000]  # number of arguments in the generated call
+API_CALLS = 2000
+PANEL_NAME = 'autosplit_benchmarks'
+VIEW_NAME = 'Sublime Autosplit benchmarks'
+
+# Wide enough for any generated call to be joined onto one line
+WIDE_RULER = 10 ** 6
+RULER = 79
+
+
+def flat_call(nargs):
+    return "result = function({})\n".format(
+        ", ".join("argument_{}".format(i) for i in range(nargs))
+    )
+
+
+def split_call(nargs):
+    return "result = function(\n{}\n)\n".format(
+        ",\n".join("    argument_{}".format(i) for i in range(nargs))
+    )
+
+
+def bench_split(view, nargs):
+    """Split a call with all args on the line of the paren"""
+    set_text(view, flat_call(nargs), WIDE_RULER)
+    set_cursor(view, view.find(r'\(', 0).end())
+    return timed(lambda: view.run_command('autosplit_split'))
+
+
+def bench_join(view, nargs):
+    """Join a call with every arg on its own line"""
+    set_text(view, split_call(nargs), WIDE_RULER)
+    set_cursor(view, view.find(r'\(', 0).end())
+    return timed(lambda: view.run_command('autosplit_join'))
+
+
+def bench_auto_split(view, nargs):
+    """What auto-split does after a keystroke past the ruler"""
+    set_text(view, flat_call(nargs), RULER)
+    pos = view.line(0).end()
+
+    def auto_split():
+        with cxt.working_on(view):
+            call_with_edit(view, lambda edit: op.split_all_if_too_long(edit, [pos]))
+
+    return timed(auto_split)
+
+
+def bench_arrows(view, nargs):
+    """Mark the joinable arglist at the cursor with an arrow"""
+    set_text(view, split_call(nargs), WIDE_RULER)
+    pos = view.find(r'\(', 0).end()
+
+    def mark():
+        with cxt.working_on(view):
+            op.mark_all_joinables_at([pos])
+
+    try:
+        return timed(mark)
+    finally:
+        with cxt.working_on(view):
+            op.erase_joinable_arrows()
+
+
+OPERATIONS = [
+    ('split', bench_split),
+    ('join', bench_join),
+    ('auto-split', bench_auto_split),
+    ('arrows', bench_arrows),
+]
+
+
+def api_calls(view):
+    """(name, function of a position) for each View API the engine calls a lot"""
+    return [
+        ('extract_tokens_with_scopes',
+         lambda pos: view.extract_tokens_with_scopes(sublime.Region(pos))),
+        ('rowcol', lambda pos: view.rowcol(pos)),
+        ('substr', lambda pos: view.substr(sublime.Region(pos, pos + 10))),
+        ('find', lambda pos: view.find('\\s+', pos)),
+    ]
+
+
+def set_text(view, text, ruler):
+    view.settings().set('rulers', [ruler])
+    call_with_edit(
+        view, lambda edit: view.replace(edit, sublime.Region(0, view.size()), text)
+    )
+    invalidate_parse_cache(view)
+
+
+def set_cursor(view, pos):
+    view.sel().clear()
+    view.sel().add(pos)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def time_api(view, fn):
+    """Mean time of one call of fn at random positions in view, in seconds"""
+    rnd = random.Random(0)
+    posns = [rnd.randrange(view.size()) for i in range(API_CALLS)]
+
+    start = time.perf_counter()
+    for pos in posns:
+        fn(pos)
+    return (time.perf_counter() - start) / API_CALLS
+
+
+def run_benchmarks(window, repeats):
+    view = benchmark_view(window)
+    lines = [
+        "AutoSplit benchmarks: Sublime Text {}, {}, {} runs each".format(
+            sublime.version(), sublime.platform(), repeats
+        ),
+        "",
+        "{:<28} {:>10}".format("View API", "us/call"),
+    ]
+
+    set_text(view, flat_call(SIZES[-1]) * 10, WIDE_RULER)
+    for name, fn in api_calls(view):
+        lines.append("{:<28} {:>10.2f}".format(name, time_api(view, fn) * 1e6))
+
+    lines += ["", "{:<12} {:>6} {:>12} {:>12}".format(
+        "operation", "args", "median ms", "best ms"
+    )]
+    for name, bench in OPERATIONS:
+        for nargs in SIZES:
+            times = sorted(bench(view, nargs) for i in range(repeats))
+            lines.append("{:<12} {:>6} {:>12.3f} {:>12.3f}".format(
+                name, nargs, times[len(times) // 2] * 1000, times[0] * 1000
+            ))
+
+    set_text(view, '', WIDE_RULER)
+
+    report = '\n'.join(lines) + '\n'
+    print(report)
+
+    panel = window.create_output_panel(PANEL_NAME)
+    panel.run_command('append', {'characters': report})
+    window.run_command('show_panel', {'panel': 'output.' + PANEL_NAME})
+
+
+def benchmark_view(window):
+    for view in window.views():
+        if view.name() == VIEW_NAME:
+            return view
+
+    view = window.new_file()
+    view.set_name(VIEW_NAME)
+    view.assign_syntax('Packages/Python/Python.sublime-syntax')
+    view.set_scratch(True)
+    return view
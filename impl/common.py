@@ -1,22 +1,79 @@
+from types import GeneratorType
+
+
 def pairwise(itbl):
     it = iter(itbl)
-    while True:
-        yield next(it), next(it)
+    return zip(it, it)
 
 
 def tracking_last(itbl):
     it = iter(itbl)
-    prev = next(it)
+    try:
+        prev = next(it)
+    except StopIteration:
+        return
 
-    while True:
+    for cur in it:
+        yield prev, False
+        prev = cur
+
+    yield prev, True
+
+
+def postorder(root, children):
+    """Iterate over a tree bottom-up (children before parents), without recursion"""
+    stack = [(root, False)]
+
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            yield node
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children(node)))
+
+
+def iterate_nested(gtor):
+    """Iterate over gtor, descending into the generators that it yields.
+
+    This is what 'yield from' does, but without nesting Python frames, so that
+    arbitrarily deep trees can be handled.
+    """
+    stack = [gtor]
+
+    while stack:
         try:
-            cur = next(it)
+            item = next(stack[-1])
         except StopIteration:
-            yield prev, True
-            break
+            stack.pop()
+            continue
 
-        yield prev, False
-        prev = cur
+        if isinstance(item, GeneratorType):
+            stack.append(item)
+        else:
+            yield item
+
+
+def trampoline(gtor):
+    """Run gtor which yields generators to be run first, getting back their results.
+
+    In gtor, 'res = yield sub()' stands for 'res = sub()' but without nesting
+    Python frames. Return the result of gtor.
+    """
+    stack = [gtor]
+    value = None
+
+    while True:
+        try:
+            sub = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            if not stack:
+                return e.value
+            value = e.value
+        else:
+            stack.append(sub)
+            value = None
 
 
 def method_for(*klasses):
@@ -1,8 +1,17 @@
 class Arglist:
-    def __init__(self, open, close, args):
+    def __init__(self, open, close, args=None, find_args=None):
         self.open = open  # after opening paren
         self.close = close  # before closing paren
-        self.args = args
+        self._args = args
+        self._find_args = find_args  # to compute args on first access if not given
+        self.flat_size = None  # when joined to 1 line, memoized by layout.flat_size()
+
+    @property
+    def args(self):
+        if self._args is None:
+            self._args = self._find_args()
+            self._find_args = None
+        return self._args
 
     @property
     def begin(self):
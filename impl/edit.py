@@ -2,6 +2,9 @@
 
 This is needed when you need to edit a view but don't want to create a dedicated
 TextCommand for this.
+
+Every such call is a transaction. Listeners use in_transaction() and is_own_change()
+to tell the plugin's own edits from the user's ones, so as not to react to them.
 """
 import sublime_plugin
 
@@ -9,34 +12,58 @@ import sublime_plugin
 __all__ = ['AutosplitThunk']
 
 
-callback = None
-callback_res = None
-callback_exc = None
+class Transaction:
+    def __init__(self, view, thunk):
+        self.view = view
+        self.thunk = thunk
+        self.res = None
+        self.exc = None
 
 
-def call_with_edit(view, thunk):
-    global callback, callback_res, callback_exc
+transactions = []  # stack of transactions being run (they may nest across views)
+own_change_counts = {}  # view.buffer_id() -> change count after the last transaction
+
 
-    callback = thunk
+def call_with_edit(view, thunk):
+    txn = Transaction(view, thunk)
+    change_count = view.change_count()
+    transactions.append(txn)
 
     try:
         view.run_command('autosplit_thunk')
-
-        if callback_exc is not None:
-            raise callback_exc
-        else:
-            return callback_res
     finally:
-        callback = None
-        callback_res = None
-        callback_exc = None
+        transactions.pop()
+        if view.change_count() != change_count:
+            own_change_counts[view.buffer_id()] = view.change_count()
+
+    if txn.exc is not None:
+        raise txn.exc
+    else:
+        return txn.res
+
+
+def in_transaction(view):
+    """Whether a transaction is modifying view's buffer (possibly through a clone)"""
+    return any(txn.view.buffer_id() == view.buffer_id() for txn in transactions)
+
+
+def is_own_change(view):
+    """Whether the latest modification of view was made by a transaction"""
+    return (
+        in_transaction(view) or
+        own_change_counts.get(view.buffer_id()) == view.change_count()
+    )
+
+
+def forget(view):
+    own_change_counts.pop(view.buffer_id(), None)
 
 
 class AutosplitThunk(sublime_plugin.TextCommand):
     def run(self, edit):
-        global callback, callback_res, callback_exc
+        txn = transactions[-1]
 
         try:
-            callback_res = callback(edit)
+            txn.res = txn.thunk(edit)
         except Exception as e:
-            callback_exc = e
+            txn.exc = e
@@ -0,0 +1,40 @@
+"""Running AutoSplit outside of Sublime Text.
+
+Importing this package makes 'sublime' and 'sublime_plugin' importable when they are
+not (i.e. when not running inside the plugin host), substituting the subsets of them
+that AutoSplit uses. The engine then works against headless.view.View, an in-memory
+stand-in for sublime.View that derives Python scopes from the 'tokenize' module.
+
+Headless tools must import this package before anything else from the plugin, and
+the plugin must be imported as a package (python -m AutoSplit.impl.<tool>).
+"""
+import sys
+
+
+def install():
+    try:
+        import sublime
+        import sublime_plugin
+    except ImportError:
+        from . import sublime
+        from . import sublime_plugin
+        sys.modules['sublime'] = sublime
+        sys.modules['sublime_plugin'] = sublime_plugin
+
+
+install()
+
+
+from .view import View
+from .view import Window
+from . import sublime as headless_sublime
+
+# Like the real module, 'sublime' exposes the View and Window classes
+headless_sublime.View = View
+headless_sublime.Window = Window
+
+
+def load_plugin():
+    """Import the plugin's commands and listeners so that View can dispatch to them"""
+    from ... import command
+    return command
@@ -0,0 +1,61 @@
+class GapOffsets:
+    """Sorted list of text offsets that is cheap to keep up to date as the text changes.
+
+    Offsets at indices past the gap are stored relative to the end of the text, so an
+    edit doesn't need to touch the offsets after it: only the ones between the gap
+    and the edit. Edits are either local (typing) or go from the end of the text to
+    its beginning (AutoSplit's replacements), so the gap moves little.
+    """
+
+    def __init__(self, offsets, text_len):
+        self.values = list(offsets)
+        self.gap = len(self.values)
+        self.text_len = text_len
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.values)
+        value = self.values[i]
+        return value if i < self.gap else value + self.text_len
+
+    def move_gap(self, k):
+        values, text_len = self.values, self.text_len
+        for i in range(self.gap, k):
+            values[i] += text_len
+        for i in range(k, self.gap):
+            values[i] -= text_len
+        self.gap = k
+
+    def bisect_right(self, pos):
+        """Index of the first offset greater than pos"""
+        lo, hi = 0, len(self.values)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if pos < self[mid]:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def grow(self, k, n):
+        """Text grows by n chars right before the offset at index k"""
+        self.move_gap(k)
+        self.text_len += n
+
+    def insert(self, k, offsets):
+        """Insert absolute offsets at index k (the gap must be at k)"""
+        assert self.gap == k
+        self.values[k:k] = offsets
+        self.gap += len(offsets)
+
+    def set(self, i, offset):
+        self.values[i] = offset if i < self.gap else offset - self.text_len
+
+    def delete(self, k0, k1):
+        """Delete offsets at indices [k0, k1) (which must be before the gap)"""
+        assert k1 <= self.gap
+        del self.values[k0:k1]
+        self.gap -= k1 - k0
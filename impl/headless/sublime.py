@@ -0,0 +1,203 @@
+"""Subset of the 'sublime' module used by AutoSplit, for running outside the editor"""
+import heapq
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+
+
+HIDDEN = 128
+DRAW_NO_OUTLINE = 256
+DRAW_NO_FILL = 32
+LAYOUT_INLINE = 0
+LAYOUT_BELOW = 1
+LAYOUT_BLOCK = 2
+HOVER_TEXT = 1
+HIDE_ON_MOUSE_MOVE_AWAY = 2
+
+
+class Region:
+    __slots__ = ('a', 'b', 'xpos')
+
+    def __init__(self, a, b=None, xpos=-1):
+        if b is None:
+            b = a
+        self.a = a
+        self.b = b
+        self.xpos = xpos
+
+    def __repr__(self):
+        return 'Region({}, {})'.format(self.a, self.b)
+
+    def __eq__(self, other):
+        return (isinstance(other, Region) and
+                self.begin() == other.begin() and self.end() == other.end())
+
+    def __hash__(self):
+        return hash((self.begin(), self.end()))
+
+    def __len__(self):
+        return self.size()
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.a - self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        else:
+            return self.begin() <= x <= self.end()
+
+    def intersects(self, other):
+        return other.begin() < self.end() and self.begin() < other.end()
+
+    def cover(self, other):
+        return Region(min(self.begin(), other.begin()), max(self.end(), other.end()))
+
+
+def score_selector(scope, selector):
+    """Score a space-separated scope against a simple (dotted) selector"""
+    score = 0
+    for depth, atom in enumerate(scope.split(), 1):
+        if atom == selector or atom.startswith(selector + '.'):
+            score = depth
+    return score
+
+
+class Settings:
+    def __init__(self, values=None, parent=None):
+        self.values = dict(values or {})
+        self.parent = parent
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        if key in self.values:
+            return self.values[key]
+        elif self.parent is not None:
+            return self.parent.get(key, default)
+        else:
+            return default
+
+    def has(self, key):
+        return key in self.values or (self.parent is not None and self.parent.has(key))
+
+    def set(self, key, value):
+        self.values[key] = value
+        for callback in list(self.callbacks.values()):
+            callback()
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def add_on_change(self, tag, callback):
+        self.callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+settings_files = {}
+
+
+def load_settings(name):
+    if name not in settings_files:
+        try:
+            with open(os.path.join(PACKAGE_DIR, name), encoding='utf-8') as f:
+                values = json.loads(re.sub(r'^\s*//.*$', '', f.read(), flags=re.M))
+        except (IOError, ValueError):
+            values = {}
+        settings_files[name] = Settings(values)
+
+    return settings_files[name]
+
+
+def save_settings(name):
+    pass
+
+
+timers = []
+timer_seq = itertools.count()
+
+
+def set_timeout(callback, delay=0):
+    due = time.perf_counter() + delay / 1000
+    heapq.heappush(timers, (due, next(timer_seq), callback))
+
+
+set_timeout_async = set_timeout
+
+
+def pop_due_timer(deadline):
+    """Pop the callback of the next timer if it's due by deadline, sleeping until then"""
+    if not timers or timers[0][0] > deadline:
+        return None
+
+    due, _, callback = heapq.heappop(timers)
+    delay = due - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+    return callback
+
+
+def run_timers(wait=False):
+    """Run due timer callbacks. With wait=True, sleep until all timers have run."""
+    while True:
+        callback = pop_due_timer(float('inf') if wait else time.perf_counter())
+        if callback is None:
+            break
+        callback()
+
+
+clipboard = ''
+
+
+def get_clipboard(size_limit=16777216):
+    return clipboard
+
+
+def set_clipboard(text):
+    global clipboard
+    clipboard = text
+
+
+def status_message(msg):
+    pass
+
+
+def cache_path():
+    return os.environ.get('AUTOSPLIT_CACHE_DIR') or os.path.join(
+        tempfile.gettempdir(), 'autosplit-cache'
+    )
+
+
+def packages_path():
+    return os.path.dirname(PACKAGE_DIR)
+
+
+def active_window():
+    return None
+
+
+def windows():
+    return []
+
+
+def version():
+    return '0'
+
+
+def platform():
+    return 'headless'
@@ -0,0 +1,63 @@
+"""Subset of 'sublime_plugin' used by AutoSplit, for running outside the editor"""
+import re
+
+
+class TextCommand:
+    def __init__(self, view):
+        self.view = view
+
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+
+class WindowCommand:
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand:
+    pass
+
+
+class EventListener:
+    pass
+
+
+class ViewEventListener:
+    def __init__(self, view):
+        self.view = view
+
+    @classmethod
+    def is_applicable(cls, settings):
+        return True
+
+    @classmethod
+    def applies_to_primary_view_only(cls):
+        return True
+
+
+def all_subclasses(klass):
+    for sub in klass.__subclasses__():
+        yield sub
+        yield from all_subclasses(sub)
+
+
+def command_name(klass):
+    name = klass.__name__
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    return re.sub(r'(?<=[a-z0-9])(?=[A-Z])', '_', name).lower()
+
+
+def find_text_command(name):
+    return next(
+        (klass for klass in all_subclasses(TextCommand) if command_name(klass) == name),
+        None
+    )
+
+
+def view_event_listeners(settings):
+    return [
+        klass for klass in all_subclasses(ViewEventListener)
+        if klass.is_applicable(settings)
+    ]
@@ -0,0 +1,191 @@
+"""Approximation of the Python syntax scopes that the engine relies on.
+
+Only the scopes listed in shared.Scope matter: arglists of function calls, their
+parens and the commas separating arguments. Everything else gets plain
+'source.python'. Tokens cover the whole text without gaps, as in Sublime.
+"""
+import io
+import keyword
+import tokenize
+
+from .offsets import GapOffsets
+
+
+BASE = 'source.python'
+ARGLIST = 'meta.function-call.arguments.python'
+GROUP = 'meta.group.python'
+OPEN_PAREN = 'punctuation.section.arguments.begin.python'
+CLOSE_PAREN = 'punctuation.section.arguments.end.python'
+COMMA = 'punctuation.separator.arguments.python'
+
+CLOSERS = {')': '(', ']': '[', '}': '{'}
+SIGNIFICANT = {
+    tokenize.NAME, tokenize.NUMBER, tokenize.STRING, tokenize.OP, tokenize.COMMENT,
+    tokenize.ERRORTOKEN
+}
+
+
+class Tokens:
+    """Tokens of a text, covering it without gaps.
+
+    Whitespace edits (which is what AutoSplit does) are applied to the tokens in
+    place instead of retokenizing the whole text: whitespace becomes part of an
+    adjacent blank token or of the token it is inserted into.
+    """
+
+    def __init__(self, begins, scopes, afters, blanks, text_len):
+        self.begins = GapOffsets(begins, text_len)
+        self.scopes = scopes  # scope of each token
+        self.afters = afters  # scope of the context right after each token
+        self.blanks = blanks  # whether each token is whitespace between significant ones
+
+    def end_of(self, i):
+        return self.begins[i + 1] if i + 1 < len(self.begins) else self.begins.text_len
+
+    def index_at(self, pos):
+        return max(0, self.begins.bisect_right(pos) - 1)
+
+    def at(self, pos):
+        i = self.index_at(pos)
+        return self.begins[i], self.end_of(i), self.scopes[i]
+
+    def intersecting(self, begin, end):
+        i = self.index_at(begin)
+        while i < len(self.begins) and self.begins[i] < end:
+            yield self.begins[i], self.end_of(i), self.scopes[i]
+            i += 1
+
+    def insert_blank(self, pos, n):
+        """n whitespace chars were inserted at pos"""
+        i = self.index_at(pos)
+        begin = self.begins[i]
+
+        if begin < pos or self.blanks[i]:
+            self.begins.grow(i + 1, n)
+        elif i > 0 and self.blanks[i - 1]:
+            self.begins.grow(i, n)
+        else:
+            scope = self.afters[i - 1] if i > 0 else BASE
+            self.begins.move_gap(i)
+            self.begins.insert(i, [pos])
+            self.begins.text_len += n
+            self.scopes.insert(i, scope)
+            self.afters.insert(i, scope)
+            self.blanks.insert(i, True)
+
+    def erase_blank(self, begin, end):
+        """Whitespace chars at [begin, end) were erased"""
+        i0 = self.begins.bisect_right(begin)
+        i1 = self.begins.bisect_right(end)
+        self.begins.move_gap(i1)
+        for i in range(i0, i1):
+            self.begins.set(i, begin)
+        self.begins.text_len -= end - begin
+
+        # Of the tokens now starting at begin, only the last one is non-empty
+        k = i0 - 1 if i0 > 0 and self.begins[i0 - 1] == begin else i0
+        if k < i1 - 1:
+            self.begins.delete(k, i1 - 1)
+            del self.scopes[k:i1 - 1]
+            del self.afters[k:i1 - 1]
+            del self.blanks[k:i1 - 1]
+
+        if len(self.begins) > 1 and self.begins[-1] == self.begins.text_len:
+            self.begins.move_gap(len(self.begins))
+            self.begins.delete(len(self.begins) - 1, len(self.begins))
+            del self.scopes[-1], self.afters[-1], self.blanks[-1]
+
+
+def tokenize_text(text):
+    line_starts = [0]
+    for line in io.StringIO(text):
+        line_starts.append(line_starts[-1] + len(line))
+
+    def offset(rowcol):
+        row, col = rowcol
+        return line_starts[row - 1] + col
+
+    begins, scopes, afters, blanks = [], [], [], []
+    stack = []  # of [bracket, is_call, in_lambda]
+    ncalls = 0  # number of call parens in the stack
+    prev = None  # previous significant token string (or None)
+    prev2 = None
+    context = BASE
+
+    def context_scope():
+        # Nesting depth doesn't matter to the engine, so keep scopes of constant size
+        scope = BASE
+        if ncalls:
+            scope += ' ' + ARGLIST
+        if stack and not stack[-1][1]:
+            scope += ' ' + GROUP
+        return scope
+
+    def emit(begin, scope, blank):
+        begins.append(begin)
+        scopes.append(scope)
+        afters.append(context)
+        blanks.append(blank)
+
+    last = 0
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(text).readline):
+            if tok.type not in SIGNIFICANT:
+                continue
+
+            begin, end = offset(tok.start), offset(tok.end)
+            s = tok.string
+
+            if tok.type == tokenize.OP and s in '([{':
+                is_call = s == '(' and is_call_paren(prev, prev2)
+                stack.append([s, is_call, False])
+                ncalls += is_call
+                scope = context_scope()
+                if is_call:
+                    scope += ' ' + OPEN_PAREN
+            elif tok.type == tokenize.OP and s in CLOSERS:
+                scope = context_scope()
+                if stack and stack[-1][0] == CLOSERS[s]:
+                    if stack[-1][1]:
+                        scope += ' ' + CLOSE_PAREN
+                    ncalls -= stack.pop()[1]
+            elif tok.type == tokenize.OP and s == ',' and stack and stack[-1][1]:
+                scope = context_scope()
+                if not stack[-1][2]:
+                    scope += ' ' + COMMA
+            else:
+                if stack and tok.type == tokenize.NAME and s == 'lambda':
+                    stack[-1][2] = True
+                elif stack and tok.type == tokenize.OP and s == ':':
+                    stack[-1][2] = False
+                scope = context_scope()
+
+            if last < begin:
+                emit(last, context if begins else BASE, True)
+            if begin < end:
+                context = context_scope()
+                emit(begin, scope, False)
+                last = end
+
+            if tok.type != tokenize.COMMENT:
+                prev2, prev = prev, (tok.type, s)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass
+
+    if last < len(text) or not begins:
+        emit(last, context if begins else BASE, True)
+
+    return Tokens(begins, scopes, afters, blanks, len(text))
+
+
+def is_call_paren(prev, prev2):
+    if prev is None:
+        return False
+
+    kind, s = prev
+    if kind == tokenize.NAME:
+        if keyword.iskeyword(s) and s not in ('None', 'True', 'False'):
+            return False
+        return prev2 is None or prev2[1] not in ('def', 'class')
+    else:
+        return kind == tokenize.OP and s in (')', ']') or kind == tokenize.STRING
@@ -0,0 +1,493 @@
+"""In-memory stand-in for sublime.View, with the scopes computed by headless.syntax"""
+import bisect
+import itertools
+import re
+import sublime
+
+from contextlib import contextmanager
+
+from . import syntax
+from .offsets import GapOffsets
+from .sublime_plugin import find_text_command
+from .sublime_plugin import view_event_listeners
+
+
+PYTHON_SYNTAX = 'Packages/Python/Python.sublime-syntax'
+
+view_ids = itertools.count(1)
+
+
+class Edit:
+    pass
+
+
+class Selection:
+    def __init__(self, view):
+        self.view = view
+        self.regions = [sublime.Region(0)]
+
+    def __iter__(self):
+        return iter(list(self.regions))
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, i):
+        return self.regions[i]
+
+    def __delitem__(self, i):
+        del self.regions[i]
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, x):
+        reg = x if isinstance(x, sublime.Region) else sublime.Region(x)
+        if reg not in self.regions:
+            self.regions.append(reg)
+            self.regions.sort(key=lambda r: (r.begin(), r.end()))
+
+    def add_all(self, regions):
+        for reg in regions:
+            self.add(reg)
+
+    def contains(self, reg):
+        return any(r.contains(reg) for r in self.regions)
+
+
+class View:
+    def __init__(self, text='', settings=None, file_name=None):
+        self.view_id = next(view_ids)
+        self.text = text
+        self._change_count = 0
+        self._settings = sublime.Settings({
+            'syntax': PYTHON_SYNTAX,
+            'tab_size': 4,
+            'rulers': [],
+        })
+        for key, value in (settings or {}).items():
+            self._settings.set(key, value)
+        self._file_name = file_name
+        self._encoding = 'UTF-8'
+        self._name = ''
+        self._sel = Selection(self)
+        self._regions = {}
+        # (bound, key) sorted by bound: no region of self._regions[key] ends past bound
+        self._region_bounds = []
+        self._phantoms = {}
+        self._phantom_ids = itertools.count(1)
+        self._status = {}
+        self._history = []
+        self._depth = 0
+        self._tokens = None
+        self._line_starts = None
+        self._listeners = None
+        self._plugin_depth = 0  # > 0 while plugin code (commands, listeners) runs
+        self._in_api = False  # whether a View method called by the plugin is running
+
+    ## Identity and settings
+    def id(self):
+        return self.view_id
+
+    def buffer_id(self):
+        return self.view_id
+
+    def is_valid(self):
+        return True
+
+    def settings(self):
+        return self._settings
+
+    def file_name(self):
+        return self._file_name
+
+    def encoding(self):
+        return self._encoding
+
+    def set_encoding(self, encoding_name):
+        self._encoding = encoding_name
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def assign_syntax(self, syntax):
+        self._settings.set('syntax', syntax)
+
+    def set_scratch(self, scratch):
+        pass
+
+    def is_loading(self):
+        return False
+
+    def is_dirty(self):
+        return False
+
+    def window(self):
+        return None
+
+    def show(self, *args, **kwargs):
+        pass
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, '')
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    ## Text
+    def size(self):
+        return len(self.text)
+
+    def change_count(self):
+        return self._change_count
+
+    def substr(self, x):
+        if isinstance(x, sublime.Region):
+            return self.text[x.begin():x.end()]
+        elif 0 <= x < len(self.text):
+            return self.text[x]
+        else:
+            return '\x00'
+
+    def find(self, pattern, start_pt, flags=0):
+        mo = re.compile(pattern).search(self.text, start_pt)
+        return sublime.Region(-1, -1) if mo is None else sublime.Region(*mo.span())
+
+    def line_starts(self):
+        if self._line_starts is None:
+            starts = [0]
+            starts.extend(mo.end() for mo in re.finditer('\n', self.text))
+            self._line_starts = GapOffsets(starts, len(self.text))
+        return self._line_starts
+
+    def rowcol(self, pos):
+        starts = self.line_starts()
+        row = starts.bisect_right(pos) - 1
+        return row, pos - starts[row]
+
+    def text_point(self, row, col):
+        starts = self.line_starts()
+        row = max(0, min(row, len(starts) - 1))
+        return min(starts[row] + col, len(self.text))
+
+    def line(self, x):
+        if isinstance(x, sublime.Region):
+            return self.line(x.begin()).cover(self.line(x.end()))
+
+        row, col = self.rowcol(x)
+        starts = self.line_starts()
+        begin = starts[row]
+        end = starts[row + 1] - 1 if row + 1 < len(starts) else len(self.text)
+        return sublime.Region(begin, end)
+
+    def lines(self, reg):
+        row0, _ = self.rowcol(reg.begin())
+        row1, _ = self.rowcol(reg.end())
+        return [self.line(self.text_point(row, 0)) for row in range(row0, row1 + 1)]
+
+    ## Scopes
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = syntax.tokenize_text(self.text)
+        return self._tokens
+
+    def scope_name(self, pos):
+        return self.tokens().at(pos)[2] + ' '
+
+    def match_selector(self, pos, selector):
+        return sublime.score_selector(self.scope_name(pos), selector) > 0
+
+    def extract_tokens_with_scopes(self, reg):
+        tokens = self.tokens()
+        if reg.empty():
+            found = [tokens.at(reg.a)]
+        else:
+            found = tokens.intersecting(reg.begin(), reg.end())
+
+        return [(sublime.Region(b, e), scope) for b, e, scope in found]
+
+    def find_by_selector(self, selector):
+        """Regions of the tokens matching selector, adjacent ones merged"""
+        tokens = self.tokens()
+        found = []
+        for i in range(len(tokens.begins)):
+            begin, end = tokens.begins[i], tokens.end_of(i)
+            if begin == end or sublime.score_selector(tokens.scopes[i], selector) == 0:
+                continue
+            if found and found[-1][1] == begin:
+                found[-1][1] = end
+            else:
+                found.append([begin, end])
+
+        return [sublime.Region(begin, end) for begin, end in found]
+
+    ## Selection, regions and phantoms
+    def sel(self):
+        return self._sel
+
+    def add_regions(self, key, regions, scope='', icon='', flags=0):
+        self.erase_regions(key)
+        self._regions[key] = [sublime.Region(r.a, r.b) for r in regions]
+        bound = max((r.end() for r in regions), default=-1)
+        bisect.insort(self._region_bounds, (bound, key))
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, ()))
+
+    def erase_regions(self, key):
+        if self._regions.pop(key, None) is not None:
+            self._region_bounds.remove(
+                next(item for item in self._region_bounds if item[1] == key)
+            )
+
+    def add_phantom(self, key, region, content, layout, on_navigate=None):
+        pid = next(self._phantom_ids)
+        self._phantoms[pid] = [key, sublime.Region(region.a, region.b), content]
+        return pid
+
+    def erase_phantoms(self, key):
+        for pid in [pid for pid, ph in self._phantoms.items() if ph[0] == key]:
+            del self._phantoms[pid]
+
+    def erase_phantom_by_id(self, pid):
+        self._phantoms.pop(pid, None)
+
+    def query_phantom(self, pid):
+        ph = self._phantoms.get(pid)
+        return [] if ph is None else [ph[1]]
+
+    def query_phantoms(self, pids):
+        return [self.query_phantom(pid)[0] for pid in pids if pid in self._phantoms]
+
+    def phantoms(self, key):
+        return [ph[1] for ph in self._phantoms.values() if ph[0] == key]
+
+    def _adjust(self, fn, first_moved):
+        """Relocate the tracked regions by fn, which moves no position before first_moved.
+
+        Region lists that end before first_moved are not looked at, so an edit costs
+        nothing for the regions that lie before it. fn never reorders positions, so the
+        bounds stay sorted.
+        """
+        sel = self._sel.regions
+        sel[:] = [adjusted_region(reg, fn) for reg in sel]
+
+        bounds = self._region_bounds
+        for i in range(bisect.bisect_left(bounds, (first_moved,)), len(bounds)):
+            bound, key = bounds[i]
+            regs = self._regions[key]
+            regs[:] = [adjusted_region(reg, fn) for reg in regs]
+            bounds[i] = fn(bound, False), key
+
+        for ph in self._phantoms.values():
+            ph[1] = adjusted_region(ph[1], fn)
+
+    ## Modification
+    def insert(self, edit, pos, s):
+        if not s:
+            return 0
+
+        n = len(s)
+        if self._tokens is not None:
+            if s.isspace():
+                self._tokens.insert_blank(pos, n)
+            else:
+                self._tokens = None
+        if self._line_starts is not None:
+            starts = self._line_starts
+            k = starts.bisect_right(pos)
+            starts.grow(k, n)
+            starts.insert(k, [pos + mo.end() for mo in re.finditer('\n', s)])
+
+        self.text = self.text[:pos] + s + self.text[pos:]
+        self._adjust(lambda p, is_begin: p + n if p > pos or (p == pos and not is_begin)
+                     else p, pos)
+        self._change_count += 1
+        return n
+
+    def erase(self, edit, reg):
+        b, e = reg.begin(), reg.end()
+        if b == e:
+            return
+
+        if self._tokens is not None:
+            if self.text[b:e].isspace():
+                self._tokens.erase_blank(b, e)
+            else:
+                self._tokens = None
+        if self._line_starts is not None:
+            starts = self._line_starts
+            k0, k1 = starts.bisect_right(b), starts.bisect_right(e)
+            starts.move_gap(k1)
+            starts.delete(k0, k1)
+            starts.text_len -= e - b
+
+        self.text = self.text[:b] + self.text[e:]
+        self._adjust(lambda p, is_begin: p - (e - b) if p >= e else min(p, b), b + 1)
+        self._change_count += 1
+
+    def replace(self, edit, reg, s):
+        self.erase(edit, reg)
+        self.insert(edit, reg.begin(), s)
+
+    ## Commands and events
+    def command_history(self, index, modifying_only=False):
+        if index <= 0 and -index < len(self._history):
+            return self._history[len(self._history) - 1 + index]
+        else:
+            return '', None, 0
+
+    def run_command(self, cmd, args=None):
+        count0 = self._change_count
+        sel0 = list(self._sel.regions)
+
+        if self._depth == 0:
+            for listener in self.listeners():
+                if hasattr(listener, 'on_text_command'):
+                    with self.running_plugin_code():
+                        listener.on_text_command(cmd, args)
+
+        self._depth += 1
+        try:
+            builtin = BUILTIN_COMMANDS.get(cmd)
+            if builtin is not None:
+                builtin(self, Edit(), **(args or {}))
+            else:
+                klass = find_text_command(cmd)
+                if klass is not None:
+                    with self.running_plugin_code():
+                        klass(self).run(Edit(), **(args or {}))
+        finally:
+            self._depth -= 1
+
+        if self._depth == 0:
+            modified = self._change_count != count0
+            if modified:
+                self._history.append((cmd, args, 1))
+            self._notify(modified, self._sel.regions != sel0)
+
+    def listeners(self):
+        if self._listeners is None:
+            self._listeners = [
+                klass(self) for klass in view_event_listeners(self._settings)
+            ]
+        return self._listeners
+
+    def _notify(self, modified, selection_modified):
+        for listener in self.listeners():
+            with self.running_plugin_code():
+                if modified and hasattr(listener, 'on_modified'):
+                    listener.on_modified()
+                if selection_modified and hasattr(listener, 'on_selection_modified'):
+                    listener.on_selection_modified()
+
+    @contextmanager
+    def running_plugin_code(self):
+        """Mark that plugin code runs, so that its View calls can be told apart"""
+        in_api, self._in_api = self._in_api, False
+        self._plugin_depth += 1
+        try:
+            yield
+        finally:
+            self._plugin_depth -= 1
+            self._in_api = in_api
+
+    def apply_user_edit(self, reg, chars, cmd, args=None):
+        """Replace reg with chars as if done by the user's command cmd.
+
+        Listeners are notified as they would be in the editor.
+        """
+        sel0 = list(self._sel.regions)
+        self.replace(Edit(), reg, chars)
+        self._history.append((cmd, args, 1))
+        self._notify(True, self._sel.regions != sel0)
+
+    def set_selection(self, regions):
+        """Move cursors as the user would do, notifying the listeners"""
+        sel0 = list(self._sel.regions)
+        self._sel.clear()
+        self._sel.add_all(regions)
+        if self._sel.regions != sel0:
+            self._notify(False, True)
+
+
+def adjusted_region(reg, fn):
+    if reg.a <= reg.b:
+        return sublime.Region(fn(reg.a, reg.a != reg.b), fn(reg.b, False))
+    else:
+        return sublime.Region(fn(reg.a, False), fn(reg.b, True))
+
+
+def cmd_insert(view, edit, characters=''):
+    for reg in reversed(list(view.sel())):
+        view.erase(edit, reg)
+        view.insert(edit, reg.begin(), characters)
+
+
+def cmd_paste(view, edit):
+    cmd_insert(view, edit, sublime.get_clipboard())
+
+
+def cmd_left_delete(view, edit):
+    for reg in reversed(list(view.sel())):
+        if reg.empty() and reg.a > 0:
+            reg = sublime.Region(reg.a - 1, reg.a)
+        view.erase(edit, reg)
+
+
+def cmd_right_delete(view, edit):
+    for reg in reversed(list(view.sel())):
+        if reg.empty():
+            reg = sublime.Region(reg.a, min(reg.a + 1, view.size()))
+        view.erase(edit, reg)
+
+
+BUILTIN_COMMANDS = {
+    'insert': cmd_insert,
+    'paste': cmd_paste,
+    'left_delete': cmd_left_delete,
+    'right_delete': cmd_right_delete,
+}
+
+
+class Window:
+    def __init__(self):
+        self._views = []
+        self._panels = {}
+        self._active = None
+
+    def id(self):
+        return 0
+
+    def views(self):
+        return list(self._views)
+
+    def new_file(self):
+        view = View()
+        self._views.append(view)
+        self._active = view
+        return view
+
+    def active_view(self):
+        return self._active
+
+    def focus_view(self, view):
+        self._active = view
+
+    def create_output_panel(self, name, unlisted=False):
+        panel = self._panels[name] = View(
+            settings={'syntax': 'Packages/Text/Plain text.tmLanguage'}
+        )
+        return panel
+
+    def find_output_panel(self, name):
+        return self._panels.get(name)
+
+    def run_command(self, cmd, args=None):
+        pass
@@ -0,0 +1,1135 @@
+"""Headless tests of AutoSplit's components, run against headless.View.
+
+    python -m AutoSplit.impl.headless_tests
+
+The behavior of the commands is tested by tests.py (inside the editor, or headlessly
+through the same View). These tests cover what those don't reach: the machinery
+around the engine.
+"""
+from . import headless
+
+import io
+import os
+import sublime
+import subprocess
+import sys
+import tempfile
+import traceback
+
+from contextlib import contextmanager
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+from random import Random
+
+from . import arglist_index
+from . import batch
+from . import memory
+from . import op
+from . import parse_cache
+from . import plan_cache
+from . import recorder
+from . import replay
+from . import result_cache
+from . import ruler_index
+from . import watchdog
+from .edit import call_with_edit
+from .headless.view import View
+from .listener import Listener
+from .listener import PENDING_SPLITS_KEY
+from .listener import changed_rows
+from .listener import VIOLATIONS_STATUS_KEY
+from .parse import TokenBudget
+from .parse import parse_at
+from .parse import tokens_leftwards
+from .shared import cxt
+from .sublime_util import get_hidden_regions
+
+
+TESTS = []
+
+
+def test(fn):
+    TESTS.append(fn)
+    return fn
+
+
+@contextmanager
+def plugin_settings(**values):
+    """Temporarily set values in the plugin's settings"""
+    settings = sublime.load_settings('AutoSplit.sublime-settings')
+    saved = {key: settings.get(key) for key in values}
+    for key, value in values.items():
+        settings.set(key, value)
+    try:
+        yield settings
+    finally:
+        for key, value in saved.items():
+            settings.set(key, value)
+
+
+def whole_text(view):
+    return view.substr(sublime.Region(0, view.size()))
+
+
+## Watchdog
+@test
+def watchdog_degrades_after_strikes():
+    """Watchdog: degrade after consecutive slow invocations only"""
+    view = View("x = 1\n" * 10)
+    with plugin_settings(latency_budget_ms=50, latency_strikes=3):
+        watchdog.record(view, 100)
+        watchdog.record(view, 100)
+        watchdog.record(view, 10)  # resets the strikes
+        watchdog.record(view, 100)
+        watchdog.record(view, 100)
+        assert not watchdog.is_degraded(view)
+
+        watchdog.record(view, 100)
+        assert watchdog.is_degraded(view)
+        assert view.get_status(watchdog.STATUS_KEY) == watchdog.STATUS_DEGRADED
+
+    watchdog.forget(view)
+
+
+@test
+def watchdog_restores_when_file_shrinks():
+    """Watchdog: restore once the file shrinks to less than half"""
+    view = View("x = 1\n" * 10)
+    watchdog.degrade(view)
+    assert watchdog.is_degraded(view)
+
+    view.erase(None, sublime.Region(0, view.size() // 2))
+    assert watchdog.is_degraded(view)
+
+    view.erase(None, sublime.Region(0, 6))
+    assert not watchdog.is_degraded(view)
+    assert view.get_status(watchdog.STATUS_KEY) == ''
+
+    watchdog.forget(view)
+
+
+@test
+def watchdog_restore_command():
+    """Watchdog: autosplit_restore_features turns features back on"""
+    view = View("x = 1\n")
+    watchdog.degrade(view)
+    view.run_command('autosplit_restore_features')
+    assert not watchdog.is_degraded(view)
+
+    watchdog.forget(view)
+
+
+@test
+def watchdog_off_without_budget():
+    """Watchdog: a budget of 0 never degrades"""
+    view = View("x = 1\n")
+    with plugin_settings(latency_budget_ms=0, latency_strikes=1):
+        for i in range(5):
+            watchdog.record(view, 10 ** 6)
+        assert not watchdog.is_degraded(view)
+
+    watchdog.forget(view)
+
+
+## Ruler index
+RULER_TEXT = "short\n" + "x" * 30 + "\nabc\n" + "y" * 40
+
+
+@test
+def ruler_index_queries():
+    """Ruler index: violations, their count, next and previous"""
+    view = View(RULER_TEXT)
+    index = ruler_index.index_for(view)
+
+    assert index.violations(10) == [1, 3]
+    assert index.count_violations(10) == 2
+    assert [index.next_violation(row, 10) for row in range(4)] == [1, 3, 3, None]
+    assert [index.prev_violation(row, 10) for row in range(4)] == [None, None, 1, 1]
+    assert index.violations(40) == []
+
+    ruler_index.forget(view)
+
+
+@test
+def ruler_index_patched_by_typing():
+    """Ruler index: typing on the cursor lines patches it in place"""
+    view = View(RULER_TEXT)
+    view.listeners()  # in the editor, they exist as soon as the view does
+    index = ruler_index.index_for(view)
+    view.sel().clear()
+    view.sel().add(view.text_point(2, 3))
+
+    view.run_command('insert', {'characters': 'z' * 20})
+    assert index.is_fresh(view)
+    assert index.total == sum(index.lengths) == view.size() - 3
+    assert index.violations(10) == [1, 2, 3]
+
+    view.sel().clear()
+    view.sel().add(view.text_point(0, 0))
+    view.run_command('insert', {'characters': 'a\nb'})  # adds a line
+    assert not index.is_fresh(view)
+    assert ruler_index.index_for(view).violations(10) == [2, 3, 4]
+
+    ruler_index.forget(view)
+
+
+@test
+def goto_violation():
+    """Ruler index: autosplit_goto_violation moves between long lines"""
+    view = View(RULER_TEXT, settings={'rulers': [10]})
+    view.sel().clear()
+    view.sel().add(0)
+
+    rows = []
+    for forward in [True, True, True, False]:
+        view.run_command('autosplit_goto_violation', {'forward': forward})
+        rows.append(view.rowcol(view.sel()[0].b))
+
+    assert rows == [(1, 10), (3, 10), (3, 10), (1, 10)]
+    ruler_index.forget(view)
+
+
+@test
+def violation_count_without_arrows():
+    """Ruler index: the violation count shows with arrows off"""
+    view = View(RULER_TEXT, settings={'rulers': [10]})
+    with plugin_settings(show_violation_count=True, show_arrows=False):
+        view.set_selection([sublime.Region(1)])
+        sublime.run_timers(wait=True)
+        assert view.get_status(VIOLATIONS_STATUS_KEY) == '2 lines past the ruler'
+
+    ruler_index.forget(view)
+
+
+## Arrows on hover
+HOVERED_TEXT = (
+    "x = call(\n"
+    "    alpha, beta\n"
+    ")\n"
+    "y = other(\n"
+    "    gamma\n"
+    ")\n"
+)
+
+
+def listener_of(view):
+    return next(lsn for lsn in view.listeners() if isinstance(lsn, Listener))
+
+
+def arrows(view):
+    return sorted(reg.a for reg in view.phantoms('autosplit:joinable'))
+
+
+@test
+def hover_arrows():
+    """Arrows on hover: shown, replaced, kept on the arrow and erased on edit"""
+    text = HOVERED_TEXT
+    view = View(text, settings={'rulers': [40], 'show_arrows': 'hover'})
+    listener = listener_of(view)
+
+    with plugin_settings(show_arrows=True):
+        view.set_selection([sublime.Region(text.index('alpha'))])
+        sublime.run_timers(wait=True)
+        assert arrows(view) == []
+
+        listener.on_hover(text.index('alpha'), sublime.HOVER_TEXT)
+        assert arrows(view) == [text.index('\n')]
+
+        listener.on_hover(text.index('gamma'), sublime.HOVER_TEXT)
+        [arrow] = arrows(view)
+        assert arrow == text.index('\n', text.index('other'))
+
+        listener.on_hover(arrow, sublime.HOVER_TEXT)
+        assert arrows(view) == [arrow]
+
+        view.apply_user_edit(sublime.Region(text.index('gamma')), 'x', 'insert')
+        assert arrows(view) == []
+
+
+@test
+def hover_arrows_setting_of_view():
+    """Arrows on hover: the view's show_arrows setting overrides the plugin's"""
+    text = HOVERED_TEXT
+    view = View(text, settings={'rulers': [40]})
+    listener = listener_of(view)
+
+    with plugin_settings(show_arrows='hover'):
+        view.settings().set('show_arrows', True)
+        listener.on_hover(text.index('alpha'), sublime.HOVER_TEXT)
+        assert arrows(view) == []
+
+        view.set_selection([sublime.Region(text.index('alpha'))])
+        sublime.run_timers(wait=True)
+        assert arrows(view) == [text.index('\n')]
+
+        view.settings().erase('show_arrows')
+        listener.on_hover(text.index('gamma'), sublime.HOVER_TEXT)
+        assert arrows(view) == [text.index('\n', text.index('other'))]
+
+
+@test
+def hover_arrows_spare_join_plans():
+    """Arrows on hover: moving the cursor doesn't plan joins ahead"""
+    text = HOVERED_TEXT
+    view = View(text, settings={'rulers': [40]})
+    listener_of(view)
+
+    calls = []
+    what_to_join_at = op.what_to_join_at
+
+    def counting(pos):
+        calls.append(pos)
+        return what_to_join_at(pos)
+
+    op.what_to_join_at = counting
+    try:
+        # Arrows at the cursor look up its join spec as well
+        for mode, joins_per_move in [('hover', 0), (False, 1), (True, 2)]:
+            del calls[:]
+            with plugin_settings(show_arrows=mode, precompute_plans=True):
+                for pos in range(text.index('alpha'), text.index('alpha') + 5):
+                    view.set_selection([sublime.Region(pos)])
+                    sublime.run_timers(wait=True)
+            assert len(calls) == 5 * joins_per_move
+    finally:
+        op.what_to_join_at = what_to_join_at
+
+
+## Deferred auto-split
+@test
+def deferred_split_once_per_row():
+    """Deferred split: keystrokes past the ruler queue one split per row"""
+    text = "x = function(alpha, beta)\n"
+    view = View(text, settings={'rulers': [26]})
+    view.sel().clear()
+    view.sel().add(text.index(')'))
+
+    calls = []
+    split_all_if_too_long = op.split_all_if_too_long
+
+    def counting(edit, posns):
+        calls.append(posns)
+        split_all_if_too_long(edit, posns)
+
+    op.split_all_if_too_long = counting
+    try:
+        with plugin_settings(auto_split_delay_ms=50):
+            for char in 'xyzzy':
+                view.run_command('insert', {'characters': char})
+            assert len(get_hidden_regions(view, PENDING_SPLITS_KEY)) == 1
+            sublime.run_timers(wait=True)
+    finally:
+        op.split_all_if_too_long = split_all_if_too_long
+
+    assert len(calls) == 1 and len(calls[0]) == 1
+    assert whole_text(view) == "x = function(\n    alpha, betaxyzzy\n)\n"
+
+
+## Format on save
+LONG_CALLS = (
+    "a = call(alpha, beta, gamma)\n"
+    "b = call(alpha, beta, gamma)\n"
+    "c = call(\n    alpha\n)\n"
+)
+
+
+@contextmanager
+def saved_file(text, encoding='utf-8'):
+    fd, path = tempfile.mkstemp(suffix='.py')
+    with os.fdopen(fd, 'w', encoding=encoding) as f:
+        f.write(text)
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
+def save(view):
+    listener = next(lsn for lsn in view.listeners() if isinstance(lsn, Listener))
+    with plugin_settings(format_on_save=True, format_on_save_budget_ms=10 ** 6):
+        listener.on_pre_save()
+
+
+@test
+def format_rows_formats_given_rows_only():
+    """Format on save: format_rows joins and splits around the given rows only"""
+    view = View(LONG_CALLS, settings={'rulers': [24]})
+    with cxt.working_on(view):
+        left = call_with_edit(
+            view, lambda edit: op.format_rows(edit, [1, 3], float('inf'))
+        )
+
+    assert left == 0
+    assert whole_text(view) == (
+        "a = call(alpha, beta, gamma)\n"
+        "b = call(\n    alpha, beta, gamma\n)\n"
+        "c = call(alpha)\n"
+    )
+
+    with cxt.working_on(view):
+        left = call_with_edit(view, lambda edit: op.format_rows(edit, [0], 0))
+    assert left == 1
+    assert whole_text(view).startswith("a = call(alpha, beta, gamma)\n")
+
+
+@test
+def format_rows_tracks_rows_through_edits():
+    """Format on save: rows an edit from below reaches are tracked, not renumbered"""
+    view = View(
+        "x = call(\n    alpha,\n    beta\n)\nw = call(\n    delta\n)\n",
+        settings={'rulers': [40]}
+    )
+    with cxt.working_on(view):
+        left = call_with_edit(
+            view, lambda edit: op.format_rows(edit, [0, 1, 2, 3], float('inf'))
+        )
+
+    assert left == 0
+    assert whole_text(view) == "x = call(alpha, beta)\nw = call(\n    delta\n)\n"
+
+
+@test
+def format_rows_finds_posns_lazily():
+    """Format on save: out of time, format_rows doesn't look at the rows left"""
+    class CountingView(View):
+        lines_looked_up = 0
+
+        def text_point(self, row, col):
+            self.lines_looked_up += 1
+            return super().text_point(row, col)
+
+    view = CountingView(
+        "a = call(alpha, beta, gamma)\n" * 30000, settings={'rulers': [24]}
+    )
+    with cxt.working_on(view):
+        left = call_with_edit(view, lambda edit: op.format_rows(edit, range(30000), 0))
+
+    assert left == 30000
+    assert view.lines_looked_up <= 1
+
+
+@test
+def format_on_save_formats_changed_rows():
+    """Format on save: only the rows changed since the file was saved are formatted"""
+    with saved_file(LONG_CALLS) as path:
+        view = View(LONG_CALLS.replace('b = ', 'bb = '), settings={'rulers': [24]},
+                    file_name=path)
+        assert changed_rows(view, float('inf')) == [1]
+        assert changed_rows(view, 0) == range(6)
+
+        save(view)
+
+    assert whole_text(view) == (
+        "a = call(alpha, beta, gamma)\n"
+        "bb = call(\n    alpha, beta, gamma\n)\n"
+        "c = call(\n    alpha\n)\n"
+    )
+
+
+@test
+def format_on_save_reads_file_encoding():
+    """Format on save: the saved file is read in the view's encoding"""
+    text = LONG_CALLS.replace('alpha', 'alph\u00e9')
+    with saved_file(text, encoding='cp1252') as path:
+        view = View(text, settings={'rulers': [24]}, file_name=path)
+        view.set_encoding('Western (Windows 1252)')
+        assert changed_rows(view, float('inf')) == []
+
+        save(view)
+
+    assert whole_text(view) == text
+
+
+## Batch formatter
+LONG_CALLS_FORMATTED = (
+    "a = call(\n    alpha, beta, gamma\n)\n"
+    "b = call(\n    alpha, beta, gamma\n)\n"
+    "c = call(alpha)\n"
+)
+
+
+def format_file(path, cache=None, version=b'', stream_threshold=float('inf')):
+    return batch.format_file(path, 24, 4, False, cache, version, stream_threshold, None)
+
+
+def file_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@test
+def batch_idempotent():
+    """Batch: formatting a formatted file changes nothing, streamed or not"""
+    for stream_threshold in (float('inf'), 0):
+        with saved_file(LONG_CALLS) as path:
+            assert format_file(path, stream_threshold=stream_threshold)
+            assert file_bytes(path) == LONG_CALLS_FORMATTED.encode()
+            assert not format_file(path, stream_threshold=stream_threshold)
+            assert file_bytes(path) == LONG_CALLS_FORMATTED.encode()
+
+
+@test
+def batch_keeps_crlf():
+    """Batch: files with CRLF line endings are written back with CRLF only"""
+    def crlf(text):
+        return text.replace('\n', '\r\n').encode()
+
+    for stream_threshold in (float('inf'), 0):
+        with saved_file('') as path:
+            with open(path, 'wb') as f:
+                f.write(crlf(LONG_CALLS))
+
+            assert format_file(path, stream_threshold=stream_threshold)
+            assert file_bytes(path) == crlf(LONG_CALLS_FORMATTED)
+            assert not format_file(path, stream_threshold=stream_threshold)
+
+
+@test
+def batch_coding_cookie():
+    """Batch: files are read and written in the encoding of their coding cookie"""
+    text = "# -*- coding: latin-1 -*-\n" + LONG_CALLS.replace('alpha', 'alph\u00e9')
+    formatted = "# -*- coding: latin-1 -*-\n" + LONG_CALLS_FORMATTED.replace(
+        'alpha', 'alph\u00e9'
+    )
+
+    for stream_threshold in (float('inf'), 0):
+        with saved_file(text, encoding='latin-1') as path:
+            assert format_file(path, stream_threshold=stream_threshold)
+            assert file_bytes(path) == formatted.encode('latin-1')
+
+
+@test
+def batch_skips_undecodable():
+    """Batch: a file that can't be decoded is reported as skipped, the rest formatted"""
+    with saved_file('') as bad_path, saved_file(LONG_CALLS) as path:
+        with open(bad_path, 'wb') as f:
+            f.write(b"x = '\xe9'\n")
+
+        out, err = io.StringIO(), io.StringIO()
+        with redirect_stdout(out), redirect_stderr(err):
+            status = batch.main(
+                ['--ruler', '24', '--no-cache', '-j', '1', '--check', bad_path, path]
+            )
+
+        assert status == 1
+        assert err.getvalue().startswith("skipped {}: ".format(bad_path))
+        assert out.getvalue().endswith("1 of 2 files would be reformatted, 1 skipped\n")
+
+
+@test
+def batch_result_cache():
+    """Batch: formatted files are cached by content and engine version"""
+    def fail(*args):
+        raise AssertionError("format_text() called on a cached file")
+
+    version = result_cache.engine_version()
+
+    with saved_file(LONG_CALLS_FORMATTED) as path:
+        cache = result_cache.ResultCache(path + '.cache')
+        assert not format_file(path, cache, version)
+        assert result_cache.cache_key(LONG_CALLS_FORMATTED, 24, 4, version) in cache
+
+        format_text, batch.format_text = batch.format_text, fail
+        try:
+            assert not format_file(path, cache, version)
+            try:
+                format_file(path, cache, b'other engine version')
+            except AssertionError:
+                pass
+            else:
+                raise AssertionError(
+                    "a file cached for another engine version was skipped"
+                )
+        finally:
+            batch.format_text = format_text
+
+    modules = result_cache.ENGINE_MODULES
+    try:
+        result_cache.ENGINE_MODULES = tuple(
+            name for name in modules if not name.startswith('headless/')
+        )
+        assert result_cache.engine_version() != version
+    finally:
+        result_cache.ENGINE_MODULES = modules
+
+
+@test
+def batch_result_cache_covers_imports():
+    """Batch: the engine version covers every module the batch formatter imports"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = (
+        "import sys, {0}.batch\n"
+        "for name, module in list(sys.modules.items()):\n"
+        "    if name.startswith('{0}.'):\n"
+        "        print(module.__file__)\n"
+    ).format(__package__)
+    output = subprocess.check_output(
+        [sys.executable, '-c', script],
+        cwd=os.path.dirname(os.path.dirname(here)), universal_newlines=True
+    )
+
+    imported = {
+        os.path.relpath(path, here).replace(os.sep, '/') for path in output.split('\n')
+        if path
+    }
+    assert imported - set(result_cache.ENGINE_MODULES) == {'result_cache.py'}
+
+
+@contextmanager
+def small_chunks(size=1024):
+    saved = batch.CHUNK_SIZE, batch.CHUNKED_MIN_SIZE
+    batch.CHUNK_SIZE, batch.CHUNKED_MIN_SIZE = size, 4 * size
+    try:
+        yield
+    finally:
+        batch.CHUNK_SIZE, batch.CHUNKED_MIN_SIZE = saved
+
+
+@test
+def batch_streamed_untokenizable():
+    """Batch: a file that can't be tokenized is cut into chunks and streamed the same"""
+    block = "def f{0}():\n    return call(alpha, beta, gamma, delta, zeta{0})\n\n\n"
+    good = ''.join(block.format(i) for i in range(150))
+    text = good + "def broken():\n        x = 1\n    y = 2\n\n\n" + good
+
+    results = []
+    with small_chunks():
+        chunks = list(batch.statement_chunks(iter(text.splitlines(True))))
+        for stream_threshold in (float('inf'), 0):
+            with saved_file(text) as path:
+                assert format_file(path, stream_threshold=stream_threshold)
+                results.append(file_bytes(path))
+
+    assert ''.join(chunks) == text
+    broken = next(i for i, chunk in enumerate(chunks) if 'broken' in chunk)
+    assert len(chunks) - broken > 2  # the rest is not one chunk
+    assert results[0] == results[1]
+
+
+@test
+def batch_chunked_same_as_whole():
+    """Batch: formatting in chunks, sequentially or on a pool, is the same as whole"""
+    block = (
+        "# {0}\n"
+        "@decorated(option={0})\n"
+        "def f{0}(alpha, beta):\n"
+        "    return call(alpha, beta, nested(gamma, delta, epsilon), zeta{0})\n"
+        "\n"
+        "\n"
+        "class C{0}:\n"
+        "    x = make(\n"
+        "        1, 2\n"
+        "    )\n"
+        "\n"
+        "    def method(self):\n"
+        "        pass\n"
+        "\n"
+        "\n"
+    )
+    text = ''.join(block.format(i) for i in range(60))
+    whole = batch.format_text(text, 40, 4)
+
+    pool = batch.ChunkPool(2)
+    try:
+        with small_chunks():
+            results = [
+                ''.join(formatted for chunk, formatted in batch.format_chunks(
+                    batch.statement_chunks(iter(text.splitlines(True))), 40, 4, chunk_pool
+                ))
+                for chunk_pool in (None, pool)
+            ]
+    finally:
+        pool.close()
+
+    assert whole != text
+    assert results == [whole, whole]
+
+
+## Parser
+@test
+def scan_stops_past_statement_line():
+    """Parser: the leftward scan stops past a line starting a statement"""
+    text = (
+        "x = foo(\n" + "    a,\n" * 1000 +
+        "    return bar(\n        alpha,\n        beta"
+    )
+    view = View(text)
+
+    with plugin_settings(max_scan_tokens=0), cxt.working_on(view):
+        regs = [reg for reg, scope in tokens_leftwards(len(text), TokenBudget())]
+        assert min(reg.begin() for reg in regs) == text.index('return')
+
+    parse_cache.forget(view)
+
+
+## Layout
+@test
+def flat_sizes_memoized():
+    """Layout: flat sizes are measured once per tree and memoized"""
+    depth = 2000
+    text = "x = " + "f(" * depth + "x" + ")" * depth + "\n"
+    view = View(text)
+
+    with plugin_settings(max_scan_tokens=0), cxt.working_on(view):
+        root = parse_at(text.index('f(') + 2)
+        assert root.min_size() == 3 * depth
+
+        arglists = [root]
+        while arglists[-1].args[0].arglists:
+            arglists.append(arglists[-1].args[0].arglists[0])
+        assert len(arglists) == depth
+        sizes = [arglist.flat_size for arglist in arglists]
+        assert sizes == list(range(3 * depth, 0, -3))
+        assert arglists[1].args[0].min_size() == 1 + 3 * (depth - 2)
+
+    parse_cache.forget(view)
+
+
+## Parse cache
+@test
+def parse_cache_hits():
+    """Parse cache: reparsing in the same state is a hit, inner arglists included"""
+    text = "x = outer(alpha, inner(beta, gamma), delta)\n"
+    view = View(text)
+    cache = parse_cache.cache_for(view)
+
+    with cxt.working_on(view):
+        outer = parse_at(text.index('alpha'))
+        misses = cache.misses
+        assert parse_at(text.index('alpha')) is outer
+        inner = parse_at(text.index('gamma'))
+        assert cache.misses == misses
+        assert (inner.open, inner.close) == (text.index('beta'), text.index('), delta'))
+
+    parse_cache.forget(view)
+
+
+@test
+def parse_cache_invalidated_by_changes():
+    """Parse cache: any modification makes entries stale"""
+    text = "x = f(alpha, beta)\n"
+    view = View(text)
+    cache = parse_cache.cache_for(view)
+
+    with cxt.working_on(view):
+        old = parse_at(text.index('beta'))
+        view.insert(None, 0, "# comment\n")
+        misses = cache.misses
+        new = parse_at(text.index('beta') + len("# comment\n"))
+        assert cache.misses == misses + 1
+        assert new is not old and new.open == old.open + len("# comment\n")
+
+    parse_cache.forget(view)
+
+
+@test
+def parse_cache_invalidated_by_replacements():
+    """Parse cache: performing replacements empties it"""
+    text = "x = f(alpha, beta)\n"
+    view = View(text, settings={'rulers': [79]})
+    cache = parse_cache.cache_for(view)
+
+    with cxt.working_on(view):
+        parse_at(text.index('beta'))
+        assert cache.entries
+        call_with_edit(view, lambda edit: op.split_all_at(edit, [text.index('beta')]))
+        assert not cache.entries
+
+    parse_cache.forget(view)
+
+
+@test
+def parse_cache_lru():
+    """Parse cache: least recently used arglists are evicted"""
+    text = "".join("f{}(a, b)\n".format(i) for i in range(parse_cache.CACHE_SIZE + 1))
+    view = View(text)
+    cache = parse_cache.cache_for(view)
+
+    with cxt.working_on(view):
+        first = parse_at(text.index('a'))
+        for i in range(1, parse_cache.CACHE_SIZE + 1):
+            call = 'f{}('.format(i)
+            parse_at(text.index(call) + len(call))
+        assert len(cache.entries) == parse_cache.CACHE_SIZE
+        assert (first.open, 0) not in cache.entries
+
+    parse_cache.forget(view)
+
+
+## Plan cache
+@test
+def plans_reused():
+    """Plan cache: precomputed split and join plans are applied as computed"""
+    text = "x = function(alpha, beta)\n"
+    pos = text.index('beta')
+    expected = View(text, settings={'rulers': [79]})
+    expected.sel().clear()
+    expected.sel().add(pos)
+    expected.run_command('autosplit_split')
+
+    view = View(text, settings={'rulers': [79]})
+    cache = plan_cache.cache_for(view)
+    with cxt.working_on(view):
+        op.precompute_plans_at(pos)
+    view.sel().clear()
+    view.sel().add(pos)
+    hits = cache.hits
+    view.run_command('autosplit_split')
+    assert cache.hits == hits + 1
+    assert whole_text(view) == whole_text(expected)
+
+    plan_cache.forget(view)
+    plan_cache.forget(expected)
+
+
+@test
+def plans_precomputed_untimed():
+    """Plan cache: precomputing plans in the background adds no latency strikes"""
+    text = "x = function(alpha, beta)\n"
+    pos = text.index('beta')
+    view = View(text, settings={'rulers': [79]})
+    listener_of(view)
+    cache = plan_cache.cache_for(view)
+
+    recorded = []
+    record = watchdog.record
+    watchdog.record = lambda view, elapsed_ms: recorded.append(elapsed_ms)
+    try:
+        with plugin_settings(show_arrows=False, show_violation_count=False,
+                             precompute_plans=True):
+            view.set_selection([sublime.Region(pos)])
+            sublime.run_timers(wait=True)
+    finally:
+        watchdog.record = record
+
+    with cxt.working_on(view):
+        assert cache.get('split', pos, op.plan_state()) is not None
+    assert recorded == []
+
+    plan_cache.forget(view)
+
+
+@test
+def plans_stale_on_state_change():
+    """Plan cache: plans are dropped when the text, ruler or tab size changes"""
+    text = "x = function(alpha, beta)\n"
+    pos = text.index('beta')
+    view = View(text, settings={'rulers': [79]})
+    cache = plan_cache.cache_for(view)
+
+    for change in [
+            lambda: view.settings().set('rulers', [40]),
+            lambda: view.settings().set('tab_size', 2),
+            lambda: view.insert(None, view.size(), "\n")]:
+        with cxt.working_on(view):
+            op.precompute_plans_at(pos)
+        change()
+        with cxt.working_on(view):
+            assert cache.get('split', pos, op.plan_state()) is None
+            assert cache.get('join', pos, op.plan_state()) is None
+
+    plan_cache.forget(view)
+
+
+## Memory budget
+def run_job(gtor):
+    """Run a scheduler job's steps to completion, return its value"""
+    try:
+        while True:
+            next(gtor)
+    except StopIteration as e:
+        return e.value
+
+
+def cached_view(text):
+    """View with parse trees cached and recently used"""
+    view = View(text)
+    with cxt.working_on(view):
+        for i in range(text.count('(')):
+            parse_at(text.index('(', text.index('f{}('.format(i))) + 1)
+    memory.touch(view)
+    return view
+
+
+@test
+def memory_evicts_least_recently_used():
+    """Memory: over budget, buffers are evicted least recently used first"""
+    text = "".join("f{}(alpha, beta, gamma)\n".format(i) for i in range(8))
+    views = [cached_view(text) for i in range(3)]
+    memory.touch(views[0])  # now the most recently used
+
+    run_job(memory.account(views[0]))  # no eviction within the budget
+    assert all(view.buffer_id() in parse_cache.caches for view in views)
+
+    size = memory.sizes[views[0].buffer_id()]
+    memory.enforce(size * 2, keep=views[2].buffer_id())
+    cached = [view.buffer_id() in parse_cache.caches for view in views]
+    assert cached == [True, False, True]
+    assert views[1].buffer_id() not in memory.sizes
+
+    for view in views:
+        memory.forget(view)
+
+
+@test
+def memory_keeps_current_buffer():
+    """Memory: the buffer being worked on is kept even over budget"""
+    view = cached_view("f0(alpha, beta)\n")
+    memory.enforce(1, keep=view.buffer_id())
+    assert view.buffer_id() in parse_cache.caches
+
+    memory.forget(view)
+    assert view.buffer_id() not in parse_cache.caches
+    assert view.buffer_id() not in memory.last_used
+
+
+@test
+def memory_report():
+    """Memory: the report lists every cache"""
+    view = cached_view("f0(alpha, beta)\n")
+    report = memory.report()
+    assert all(name in report for name in memory.CACHES)
+    memory.forget(view)
+
+
+## Arglist index
+INDEXED_TEXT = """\
+def f(alpha, beta=(1, 2)):
+    return call(
+        alpha,
+        nested(beta, [x for x in range(3)]),
+        "not (an, arglist)",
+    )
+
+
+def g():
+    raise Error(
+        message(1), 2
+    )
+    assert check(first(), second(
+        third
+    )), "message"
+    with opened(path,
+                mode) as f:
+        del items[index(
+            f
+        )]
+    key = lambda a, b: (a, b)
+    return sorted(values(), key=key)(
+    )
+
+
+"""
+
+
+@contextmanager
+def indexing_small_files():
+    min_size, arglist_index.MIN_SIZE = arglist_index.MIN_SIZE, 0
+    try:
+        yield
+    finally:
+        arglist_index.MIN_SIZE = min_size
+
+
+def arglist_shapes(view):
+    """Arglist and its parent at each position of view (each parsed afresh)"""
+    def shape(arglist):
+        if arglist is None:
+            return None
+        return arglist.open, arglist.close, [
+            (arg.begin, arg.end, [shape(sub) for sub in arg.arglists])
+            for arg in arglist.args
+        ]
+
+    shapes = []
+    with cxt.working_on(view):
+        for pos in range(view.size() + 1):
+            parse_cache.forget(view)
+            arglist = parse_at(pos)
+            shapes.append((shape(arglist), shape(arglist and arglist.parse_parent())))
+
+    parse_cache.forget(view)
+    return shapes
+
+
+@test
+def arglist_index_matches_scan():
+    """Arglist index: arglists found through the index are the ones found by scanning"""
+    view = View(INDEXED_TEXT * 3)
+
+    with plugin_settings(max_scan_tokens=0), indexing_small_files():
+        scanned = arglist_shapes(view)
+        run_job(arglist_index.ensure_index(view))
+        sublime.run_timers()
+        assert arglist_index.fresh_index(view) is not None
+        indexed = arglist_shapes(view)
+
+    assert indexed == scanned
+    arglist_index.forget(view)
+
+
+def reference_structure(open_posns, close_posns, comma_posns):
+    """Arrays of arglist_index.structure(), computed the plain way"""
+    kinds = {}
+    for kind, posns in enumerate([open_posns, close_posns, comma_posns]):
+        for pos in posns:
+            kinds[pos] = kind
+
+    opens, closes, parents = [], [], []
+    commas, children = {}, {}  # arglist -> its commas/children
+    stack = []
+    for pos in sorted(kinds):
+        kind = kinds[pos]
+        if kind == arglist_index.OPEN:
+            parent = stack[-1] if stack else -1
+            children.setdefault(parent, []).append(len(opens))
+            stack.append(len(opens))
+            opens.append(pos + 1)
+            closes.append(arglist_index.INCOMPLETE)
+            parents.append(parent)
+        elif not stack:
+            continue
+        elif kind == arglist_index.CLOSE:
+            closes[stack.pop()] = pos
+        else:
+            commas.setdefault(stack[-1], []).append(pos)
+
+    def csr(groups):
+        starts, values = [0], []
+        for i in range(len(opens)):
+            values.extend(groups.get(i, ()))
+            starts.append(len(values))
+        return starts, values
+
+    return [opens, closes, parents] + list(csr(commas)) + list(csr(children))
+
+
+@test
+def arglist_index_structure():
+    """Arglist index: structure() matches parens like a plain stack does"""
+    rand = Random(0)
+    for _ in range(3000):
+        posns = ([], [], [])
+        pos = 0
+        for _ in range(rand.randrange(40)):
+            pos += rand.randrange(1, 4)
+            posns[rand.choice([0, 0, 1, 1, 2])].append(pos)
+
+        index = arglist_index.structure(*posns)
+        assert [list(arr) for arr in index.arrays()] == reference_structure(*posns), posns
+
+
+@test
+def arglist_index_built_async():
+    """Arglist index: built on the async thread, dropped if the text changes meanwhile"""
+    view = View(INDEXED_TEXT)
+
+    with indexing_small_files():
+        run_job(arglist_index.ensure_index(view))
+        assert arglist_index.fresh_index(view) is None
+        view.run_command('insert', {'characters': ' '})
+        sublime.run_timers()
+        assert arglist_index.fresh_index(view) is None
+
+        run_job(arglist_index.ensure_index(view))
+        sublime.run_timers()
+        assert arglist_index.fresh_index(view) is not None
+
+    arglist_index.forget(view)
+
+
+@test
+def arglist_index_saved_and_loaded():
+    """Arglist index: the index of a saved file is reused when it's opened again"""
+    def fail(*positions):
+        raise AssertionError("index rebuilt instead of loaded")
+
+    with saved_file(INDEXED_TEXT) as path, indexing_small_files():
+        view = View(INDEXED_TEXT, file_name=path)
+        run_job(arglist_index.ensure_index(view))
+        sublime.run_timers()
+        built = arglist_index.fresh_index(view)
+
+        reopened = View(INDEXED_TEXT, file_name=path)
+        structure, arglist_index.structure = arglist_index.structure, fail
+        try:
+            run_job(arglist_index.ensure_index(reopened))
+            sublime.run_timers()
+        finally:
+            arglist_index.structure = structure
+        loaded = arglist_index.fresh_index(reopened)
+
+        os.remove(arglist_index.index_path(path))
+
+    assert loaded is not None and loaded.arrays() == built.arrays()
+    arglist_index.forget(view)
+    arglist_index.forget(reopened)
+
+
+## Recording
+@test
+def recording_replays_to_same_text():
+    """Recorder: a recorded session replays to the same text"""
+    text = "def f():\n    result = call(alpha, beta, gamma)\n"
+    view = View(text, settings={'rulers': [40]})
+    view.listeners()
+    pos = text.index('gamma')
+
+    with plugin_settings(auto_split_delay_ms=0, show_arrows=False):
+        path = recorder.start(view)
+        try:
+            view.set_selection([sublime.Region(pos)])
+            view.apply_user_edit(sublime.Region(pos), 'delta, ', 'insert',
+                                 {'characters': 'delta, '})
+            split = whole_text(view)
+            view.run_command('autosplit_split')
+            assert whole_text(view) != split
+            view.run_command('autosplit_join')
+            assert whole_text(view) == split
+            view.set_selection([sublime.Region(view.size())])
+            view.apply_user_edit(sublime.Region(view.size()), 'x = 1\n', 'paste')
+            sublime.run_timers()
+        finally:
+            recorder.stop(view)
+
+        entries = replay.load(path)
+        assert [
+            (entry['kind'], entry['cmd']) for entry in entries
+            if entry['kind'] in ('edit', 'command')
+        ] == [
+            ('edit', 'insert'), ('command', 'autosplit_split'),
+            ('command', 'autosplit_join'), ('edit', 'paste')
+        ]
+        assert entries[-1]['text'] == whole_text(view) != text
+
+        session = replay.Replay(entries, wait=False)
+        session.run()
+        assert session.final_text == session.recorded_text
+
+    os.remove(path)
+
+
+def run_tests():
+    headless.load_plugin()
+    failed = 0
+
+    for fn in TESTS:
+        try:
+            fn()
+        except Exception:
+            failed += 1
+            print("# {}: FAILURE".format(fn.__doc__))
+            traceback.print_exc(file=sys.stdout)
+        else:
+            print("# {}: SUCCESS".format(fn.__doc__))
+
+    if failed:
+        print("# FAILURE ({} failed)".format(failed))
+    else:
+        print("# SUCCESS ({} tests passed)".format(len(TESTS)))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests())
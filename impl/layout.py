@@ -0,0 +1,161 @@
+"""Fitting a whole arglist tree to the ruler in one go.
+
+Every arglist is given one of 3 forms:
+
+    INLINE: args on the row of the opening paren, all nested arglists inline too
+    ROW1: args on the next row, closing paren on the row after that; nested inline
+    MULTI: every arg on its own row; nested arglists are fitted recursively
+
+The most compact form that fits is picked top-down. This relies on flat (fully
+joined) widths of arglists which are computed bottom-up and memoized on the arglists.
+"""
+from sublime import Region
+
+from .common import iterate_nested
+from .common import postorder
+from .common import trampoline
+from .shared import cxt
+from .sublime_util import col_at
+from .sublime_util import indentation_at
+from .sublime_util import on_same_line
+from .sublime_util import rstrip_pos
+
+
+INLINE = 'inline'
+ROW1 = 'row1'
+MULTI = 'multi'
+
+
+class Layout:
+    def __init__(self, root, grow_only):
+        # If grow_only, arglists are never made more compact than they already are:
+        # this is for splitting. Otherwise any form can be chosen: this is for joining.
+        self.grow_only = grow_only
+        self.ruler = float('inf') if cxt.ruler is None else cxt.ruler
+        self.forms = {}
+        flat_size(root)  # measures the whole tree
+
+    def flat_size(self, arglist):
+        return arglist.flat_size
+
+    def flat_int_size(self, arglist):
+        return arglist.flat_size - 2
+
+    def allowed(self, arglist, form):
+        if not self.grow_only or form == MULTI:
+            return True
+        elif form == INLINE:
+            return on_same_line(cxt.view, arglist.begin, arglist.end)
+        else:
+            return on_same_line(cxt.view, arglist.args[0].begin, arglist.args[-1].end)
+
+    def fit(self, arglist, col, ind, tail):
+        """Choose the forms of arglist and its descendants.
+
+        This is to be run with 'trampoline' (nesting may be arbitrarily deep).
+
+        :param col: column of the opening paren
+        :param ind: indentation of the row of the opening paren
+        :param tail: size of whatever follows the closing paren on its row
+        :return: column right after the closing paren
+        """
+        if not arglist.args:
+            self.forms[arglist] = INLINE
+            return col + self.flat_size(arglist)
+
+        if (self.allowed(arglist, INLINE) and
+                col + self.flat_size(arglist) + tail <= self.ruler):
+            self.forms[arglist] = INLINE
+            return col + self.flat_size(arglist)
+
+        ind1 = ind + cxt.tab_size
+
+        if (self.allowed(arglist, ROW1) and
+                ind1 + self.flat_int_size(arglist) <= self.ruler):
+            self.forms[arglist] = ROW1
+        else:
+            self.forms[arglist] = MULTI
+            for arg in arglist.args:
+                yield self.fit_arg(arg, ind1, ind1)
+
+        return ind + 1
+
+    def fit_arg(self, arg, col, ind):
+        """Fit nested arglists of an arg that starts at col on a fresh row"""
+        rest = arg_flat_size(arg)
+        prev = arg.begin
+
+        for sub in arg.arglists:
+            col += sub.begin - prev
+            rest -= sub.begin - prev + self.flat_size(sub)
+            col = yield self.fit(sub, col, ind, rest)
+            prev = sub.end
+
+    def replacements(self, arglist, ind):
+        """Generate replacements, to be run with 'iterate_nested'"""
+        # Arglists nested in INLINE and ROW1 ones are not visited by 'fit'
+        form = self.forms.get(arglist, INLINE)
+
+        if not arglist.args:
+            if form == INLINE and not self.grow_only:
+                yield Region(arglist.open, arglist.close), ''
+            return
+
+        if form == INLINE:
+            first, between, last = '', ' ', ''
+        else:
+            first = '\n' + chr(0x20) * (ind + cxt.tab_size)
+            between = chr(0x20) if form == ROW1 else first
+            last = '\n' + chr(0x20) * ind
+
+        prev, rplc = arglist.open, first
+        for arg in arglist.args:
+            yield Region(prev, arg.begin), rplc
+            for sub in arg.arglists:
+                yield self.replacements(sub, ind + cxt.tab_size)
+            prev, rplc = arg.end, between
+
+        yield Region(prev, arglist.close), last
+
+
+def flat_size(arglist):
+    """Size of arglist when joined to 1 line, parens included.
+
+    Computed bottom-up, without recursion. Complete arglists don't change, so sizes are
+    memoized on them: subtrees that were measured before are not walked again.
+    """
+    if arglist.flat_size is None:
+        for sub in postorder(arglist, unmeasured_subarglists):
+            spaces_between = max(0, len(sub.args) - 1)
+            sub.flat_size = 2 + spaces_between + sum(map(arg_flat_size, sub.args))
+
+    return arglist.flat_size
+
+
+def arg_flat_size(arg):
+    """Size of arg when joined to 1 line; its arglists must have been measured"""
+    return (
+        arg.end - arg.begin -
+        sum(sub.end - sub.begin - sub.flat_size for sub in arg.arglists)
+    )
+
+
+def unmeasured_subarglists(arglist):
+    return [sub for sub in subarglists(arglist) if sub.flat_size is None]
+
+
+def subarglists(arglist):
+    return [sub for arg in arglist.args for sub in arg.arglists]
+
+
+def replacements_for_fit(arglist, grow_only):
+    """Generate replacements laying out arglist and its descendants to fit the ruler.
+
+    arglist must not contain unerasable linebreaks.
+    """
+    layout = Layout(arglist, grow_only)
+    ind = indentation_at(cxt.view, arglist.begin)
+    tail = rstrip_pos(cxt.view, arglist.end) - arglist.end
+    trampoline(layout.fit(arglist, col_at(cxt.view, arglist.begin), ind, tail))
+
+    yield from iterate_nested(layout.replacements(arglist, ind))
@@ -1,10 +1,31 @@
+import codecs
+import difflib
+import os
+import sublime
 import sublime_plugin
+import time
 
+from . import arglist_index
+from . import edit
+from . import memory
 from . import op
+from . import parse_cache
+from . import plan_cache
+from . import recorder
+from . import ruler_index
+from . import scheduler
+from . import watchdog
 from .edit import call_with_edit
+from .edit import in_transaction
+from .edit import is_own_change
+from .recorder import common_length
 from .shared import cxt
-from .sublime_util import if_not_called_for
+from .sublime_util import add_hidden_regions
+from .sublime_util import erase_hidden_regions
+from .sublime_util import get_hidden_regions
+from .sublime_util import has_clones
 from .sublime_util import line_too_long
+from .sublime_util import on_same_line
 from .sublime_util import redo_empty
 
 
@@ -16,7 +37,31 @@ class Listener(sublime_plugin.ViewEventListener):
     def is_applicable(cls, settings):
         return settings.get('syntax') == 'Packages/Python/Python.sublime-syntax'
 
+    def __init__(self, view):
+        super().__init__(view)
+        self.change_count = view.change_count()
+        self.hover_arrow_posns = set()  # of the arrow shown on hover, if any
+
     def on_modified(self):
+        prev_change_count, self.change_count = self.change_count, self.view.change_count()
+        ruler_index.note_modified(self.view, prev_change_count)
+
+        if self.hover_arrow_posns:
+            self.hover_arrow_posns = set()
+            with cxt.working_on(self.view):
+                op.erase_joinable_arrows()
+
+        rec = recorder.recorder_for(self.view)
+        if rec is not None:
+            rec.note_modified(self.view, is_own_change(self.view))
+
+        if is_own_change(self.view) or watchdog.is_degraded(self.view):
+            return
+
+        with watchdog.timed(self.view):
+            self.split_if_too_long()
+
+    def split_if_too_long(self):
         if not redo_empty(self.view):
             return
 
@@ -28,17 +73,278 @@ class Listener(sublime_plugin.ViewEventListener):
             if cxt.ruler is None:
                 return
 
-            if any(line_too_long(self.view, reg.b, cxt.ruler) for reg in self.view.sel()):
-                def do_split(edit):
-                    op.erase_joinable_arrows()
-                    op.split_all_if_too_long(edit, [reg.b for reg in self.view.sel()])
+            posns = [
+                reg.b for reg in self.view.sel()
+                if line_too_long(self.view, reg.b, cxt.ruler)
+            ]
+            if not posns:
+                return
+
+            delay_ms = cxt.settings.get('auto_split_delay_ms')
+            if delay_ms:
+                self.defer_split(posns, delay_ms)
+            else:
+                self.split_at(posns)
+
+    def defer_split(self, posns, delay_ms):
+        """Split at posns once the user stops typing for delay_ms"""
+        # One position per row, the latest one
+        by_row = {}
+        for reg in get_hidden_regions(self.view, PENDING_SPLITS_KEY) + [
+                sublime.Region(pos) for pos in posns]:
+            by_row[self.view.rowcol(reg.b)[0]] = reg
+        add_hidden_regions(
+            self.view, PENDING_SPLITS_KEY, sorted(by_row.values(), key=lambda reg: reg.b)
+        )
 
-                call_with_edit(self.view, do_split)
+        scheduler.schedule(
+            self.view, 'deferred split', self.split_pending, scheduler.PRIORITY_SPLIT,
+            delay_ms=delay_ms, cancel_on_change=False
+        )
+
+    def split_pending(self):
+        """Split at pending positions, except where the cursor has moved away from"""
+        if not self.view.is_valid():
+            return
+
+        pending = get_hidden_regions(self.view, PENDING_SPLITS_KEY)
+        erase_hidden_regions(self.view, PENDING_SPLITS_KEY)
+
+        posns = [
+            reg.b for reg in pending
+            if any(on_same_line(self.view, reg.b, cur.b) for cur in self.view.sel())
+        ]
+        if not posns or watchdog.is_degraded(self.view):
+            return
+
+        with cxt.working_on(self.view):
+            if cxt.ruler is not None:
+                self.split_at(posns)
+
+    def split_at(self, posns):
+        def do_split(edit):
+            op.erase_joinable_arrows()
+            op.split_all_if_too_long(edit, posns)
+
+        call_with_edit(self.view, do_split)
+        # Selection events caused by the split itself are skipped, so refresh once
+        self.refresh()
 
-    @if_not_called_for(300)
     def on_selection_modified(self):
+        if in_transaction(self.view):
+            return
+
+        rec = recorder.recorder_for(self.view)
+        if rec is not None:
+            rec.note_selection(self.view)
+
+        scheduler.note_activity(self.view)
+        self.refresh()
+
+    def on_text_command(self, command_name, args):
+        rec = recorder.recorder_for(self.view)
+        if rec is not None:
+            rec.note_command(command_name, args)
+
+    def refresh(self):
+        memory.touch(self.view)
+        if arrows_mode(self.view) != ARROWS_ON_HOVER:
+            scheduler.schedule(
+                self.view, 'arrows', self.show_arrows, scheduler.PRIORITY_ARROWS
+            )
+        scheduler.schedule(
+            self.view, 'plans', self.precompute_plans, scheduler.PRIORITY_PLANS
+        )
+        scheduler.schedule(
+            self.view, 'violation count', self.update_violation_count,
+            scheduler.PRIORITY_INDEX
+        )
+        scheduler.schedule(
+            self.view, 'memory', lambda: memory.account(self.view),
+            scheduler.PRIORITY_MEMORY, delay_ms=MEMORY_ACCOUNTING_DELAY_MS
+        )
+        self.schedule_arglist_index()
+
+    def on_load(self):
+        self.schedule_arglist_index()
+
+    def schedule_arglist_index(self):
+        if self.view.size() >= arglist_index.MIN_SIZE:
+            scheduler.schedule(
+                self.view, 'arglist index', lambda: arglist_index.ensure_index(self.view),
+                scheduler.PRIORITY_INDEX, delay_ms=ARGLIST_INDEX_DELAY_MS
+            )
+
+    def show_arrows(self):
+        """Job that shows arrows at the cursors, one cursor per step"""
+        with cxt.working_on(self.view):
+            op.erase_joinable_arrows()
+            if (cxt.ruler is None or watchdog.is_degraded(self.view) or
+                    arrows_mode(self.view) in (False, ARROWS_ON_HOVER)):
+                return
+
+        arrow_posns = set()
+        for pos in [reg.b for reg in self.view.sel()]:
+            with cxt.working_on(self.view), watchdog.timed(self.view):
+                op.mark_joinable_at(pos, arrow_posns)
+            yield
+
+    def on_hover(self, point, hover_zone):
+        """Show the arrow of the arglist under the mouse, in the hover mode of arrows"""
+        if hover_zone != sublime.HOVER_TEXT or arrows_mode(self.view) != ARROWS_ON_HOVER:
+            return
+
+        # Moving onto the arrow to click it
+        if point in self.hover_arrow_posns:
+            return
+
         with cxt.working_on(self.view):
+            if cxt.ruler is None or watchdog.is_degraded(self.view):
+                return
+
             op.erase_joinable_arrows()
-            if cxt.ruler is None or not cxt.settings.get('show_arrows'):
+            self.hover_arrow_posns = set()
+            with watchdog.timed(self.view):
+                op.mark_joinable_at(point, self.hover_arrow_posns)
+
+    def precompute_plans(self):
+        """Job that computes split/join plans at the cursors, one cursor per step"""
+        with cxt.working_on(self.view):
+            if (watchdog.is_degraded(self.view) or
+                    not cxt.settings.get('precompute_plans')):
+                return
+
+        # The hover mode of arrows is there to spare the join work at the cursors
+        if arrows_mode(self.view) == ARROWS_ON_HOVER:
+            kinds = ('split',)
+        else:
+            kinds = tuple(op.PLANNERS)
+
+        # Not timed: nothing waits on this speculative work, so it can't slow the user
+        for pos in [reg.b for reg in self.view.sel()][:MAX_PLANNED_CURSORS]:
+            with cxt.working_on(self.view):
+                op.precompute_plans_at(pos, kinds)
+            yield
+
+    def update_violation_count(self):
+        with cxt.working_on(self.view):
+            if (cxt.ruler is None or watchdog.is_degraded(self.view) or
+                    not cxt.settings.get('show_violation_count')):
                 return
-            op.mark_all_joinables_at([reg.b for reg in cxt.view.sel()])
+
+            with watchdog.timed(self.view):
+                show_violation_count(self.view, cxt.ruler)
+
+    def on_pre_save(self):
+        with cxt.working_on(self.view):
+            if not cxt.settings.get('format_on_save') or cxt.ruler is None:
+                return
+
+            budget_ms = cxt.settings.get('format_on_save_budget_ms')
+            deadline = time.perf_counter() + budget_ms / 1000
+
+            rows = changed_rows(self.view, deadline)
+            left = call_with_edit(
+                self.view, lambda edit: op.format_rows(edit, rows, deadline)
+            )
+
+        if left:
+            sublime.status_message(
+                "AutoSplit: out of time formatting on save, {} changed lines left "
+                "as is".format(left)
+            )
+
+    def on_close(self):
+        recorder.stop(self.view)
+        scheduler.forget(self.view)
+        watchdog.forget(self.view)
+
+        # Per-buffer state is shared with clones
+        if not has_clones(self.view):
+            edit.forget(self.view)
+            arglist_index.forget(self.view)
+            parse_cache.forget(self.view)
+            plan_cache.forget(self.view)
+            ruler_index.forget(self.view)
+            memory.forget(self.view)
+
+
+def arrows_mode(view):
+    """True, False or ARROWS_ON_HOVER, as set for the view or else for the plugin"""
+    mode = view.settings().get('show_arrows')
+    if mode is None:
+        mode = sublime.load_settings('AutoSplit.sublime-settings').get('show_arrows')
+    return mode if mode == ARROWS_ON_HOVER else bool(mode)
+
+
+def show_violation_count(view, ruler):
+    n = ruler_index.index_for(view).count_violations(ruler)
+    if n:
+        view.set_status(VIOLATIONS_STATUS_KEY, '{} lines past the ruler'.format(n))
+    else:
+        view.erase_status(VIOLATIONS_STATUS_KEY)
+
+
+def changed_rows(view, deadline):
+    """Rows of the view that differ from the file on disk (all rows if there's none).
+
+    Leading and trailing lines that are the same are skipped without diffing. The lines
+    in between are diffed only if there's time left before deadline and there are not
+    too many of them; otherwise they are all taken for changed. Past deadline, the file
+    isn't read at all.
+    """
+    lines = view.substr(sublime.Region(0, view.size())).split('\n')
+
+    path = view.file_name()
+    if path is None or not os.path.isfile(path) or time.perf_counter() > deadline:
+        return range(len(lines))
+
+    with open(path, encoding=file_encoding(view), errors='replace') as f:
+        saved_lines = f.read().split('\n')
+
+    n = min(len(lines), len(saved_lines))
+    head = common_length(lambda k: lines[:k] == saved_lines[:k], n)
+    tail = common_length(
+        lambda k: lines[len(lines) - k:] == saved_lines[len(saved_lines) - k:], n - head
+    )
+    lines = lines[head:len(lines) - tail]
+    saved_lines = saved_lines[head:len(saved_lines) - tail]
+
+    if (time.perf_counter() > deadline or
+            len(lines) * len(saved_lines) > MAX_DIFFED_LINE_PAIRS):
+        # A deletion leaves no rows behind; the row it happened at counts as changed
+        return range(head, head + max(len(lines), 1))
+
+    matcher = difflib.SequenceMatcher(None, saved_lines, lines, autojunk=False)
+    rows = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        rows.extend(range(head + j1, head + max(j2, j1 + 1)))
+
+    return rows
+
+
+def file_encoding(view):
+    """Python codec for the view's encoding, UTF-8 if Python has none for it"""
+    name = view.encoding()
+    # E.g. 'Western (Windows 1252)', 'UTF-8 with BOM', 'UTF-16 LE with BOM'
+    if '(' in name:
+        name = name[name.index('(') + 1:name.rindex(')')]
+    if name.endswith(' with BOM'):
+        name = 'utf-8-sig' if name.startswith('UTF-8') else 'utf-16'
+
+    try:
+        return codecs.lookup(name.replace(' ', '-')).name
+    except LookupError:
+        return 'utf-8'
+
+
+VIOLATIONS_STATUS_KEY = 'autosplit_violations'
+ARROWS_ON_HOVER = 'hover'
+PENDING_SPLITS_KEY = 'pending splits'
+MAX_DIFFED_LINE_PAIRS = 10 ** 6  # changed line spans beyond that are not diffed
+MAX_PLANNED_CURSORS = 16
+MEMORY_ACCOUNTING_DELAY_MS = 2000
+ARGLIST_INDEX_DELAY_MS = 1000
+
@@ -0,0 +1,180 @@
+"""Accounting of memory held by the plugin, with a global budget for its caches.
+
+Caches (parse trees, split/join plans, ruler and arglist indices) are per buffer and
+can be rebuilt at any time, so they are evicted when their total estimated size exceeds
+the 'memory_budget_mb' setting: whole buffers at a time, least recently used first. The
+buffer being worked on is not evicted. Sizes are estimated by walking the cached
+objects, which happens in a low-priority scheduler job rather than on every edit.
+
+Other state (scheduler jobs, latency strikes, recorders, hidden region keys) is not
+evictable, but it is reported along with the caches. It's per view and released when
+the view is closed. Phantoms (the arrows) are owned by the view itself.
+"""
+import sublime
+import sys
+
+from collections import OrderedDict
+from collections import deque
+from functools import partial
+from types import BuiltinFunctionType
+from types import FunctionType
+from types import MethodType
+from types import ModuleType
+
+from . import arglist_index
+from . import parse_cache
+from . import plan_cache
+from . import recorder
+from . import ruler_index
+from . import scheduler
+from . import sublime_util
+from . import watchdog
+
+
+# Evictable caches: name -> dict keyed by view.buffer_id()
+CACHES = OrderedDict([
+    ('parse trees', parse_cache.caches),
+    ('plans', plan_cache.caches),
+    ('ruler indices', ruler_index.indices),
+    ('arglist indices', arglist_index.indices),
+])
+
+# Per-view state: name -> dict keyed by view.id() (or by (view.id(), ...))
+STATE = OrderedDict([
+    ('scheduled jobs', scheduler.jobs),
+    ('typing cadences', scheduler.cadences),
+    ('latency health', watchdog.health),
+    ('recorders', recorder.recorders),
+])
+
+# Objects not to walk into: they are not held on behalf of the caches
+OPAQUE_TYPES = (
+    sublime.View, sublime.Window, type, ModuleType, FunctionType, BuiltinFunctionType
+)
+
+
+last_used = OrderedDict()  # view.buffer_id() -> None, least recently used first
+sizes = {}  # view.buffer_id() -> estimated bytes in caches, as of the last accounting
+
+
+def touch(view):
+    last_used[view.buffer_id()] = None
+    last_used.move_to_end(view.buffer_id())
+
+
+def forget(view):
+    """Release everything held for view's buffer (when its last view is closed)"""
+    release(view.buffer_id())
+
+
+def release(buffer_id):
+    for store in CACHES.values():
+        store.pop(buffer_id, None)
+    last_used.pop(buffer_id, None)
+    sizes.pop(buffer_id, None)
+
+
+def deep_size(root):
+    """Estimated number of bytes taken by root and the objects it refers to"""
+    seen = set()
+    total = 0
+    stack = [root]
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, OPAQUE_TYPES):
+            continue
+
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif isinstance(obj, partial):
+            stack.append(obj.func)
+            stack.extend(obj.args)
+        elif isinstance(obj, MethodType):
+            stack.append(obj.__self__)
+        elif hasattr(obj, '__dict__'):
+            stack.append(vars(obj))
+
+    return total
+
+
+def buffer_size(buffer_id):
+    return sum(deep_size(store.get(buffer_id)) for store in CACHES.values())
+
+
+def account(view):
+    """Job that re-estimates cache sizes, one buffer per step, then enforces the budget"""
+    sizes.clear()
+    for buffer_id in buffers_by_recency():
+        sizes[buffer_id] = buffer_size(buffer_id)
+        yield
+
+    enforce(budget_bytes(), keep=view.buffer_id())
+
+
+def buffers_by_recency():
+    """Buffers having cached data, least recently used first"""
+    cached = set()
+    for store in CACHES.values():
+        cached.update(store)
+
+    used = [buffer_id for buffer_id in last_used if buffer_id in cached]
+    return list(cached.difference(used)) + used
+
+
+def budget_bytes():
+    settings = sublime.load_settings('AutoSplit.sublime-settings')
+    return (settings.get('memory_budget_mb') or 0) * 1024 * 1024
+
+
+def enforce(budget, keep):
+    """Evict least recently used buffers (except keep) until the caches fit budget"""
+    if not budget:
+        return
+
+    total = sum(sizes.values())
+    for buffer_id in buffers_by_recency():
+        if total <= budget:
+            break
+        if buffer_id != keep:
+            total -= sizes.get(buffer_id, 0)
+            release(buffer_id)
+
+
+def report():
+    """Text describing the memory held by the plugin"""
+    lines = ["AutoSplit memory usage (estimated)", ""]
+
+    totals = OrderedDict(
+        (name, sum(deep_size(cache) for cache in store.values()))
+        for name, store in CACHES.items()
+    )
+    for name, store in CACHES.items():
+        lines.append("{:<20} {:>6} buffers {:>12} bytes".format(
+            name, len(store), totals[name]
+        ))
+
+    budget = budget_bytes()
+    lines.append("{:<20} {:>27} bytes (budget: {})".format(
+        "caches in total", sum(totals.values()),
+        "{} MB".format(budget // (1024 * 1024)) if budget else "none"
+    ))
+    lines.append("")
+
+    for name, store in STATE.items():
+        lines.append("{:<20} {:>6} entries {:>12} bytes".format(
+            name, len(store), deep_size(store)
+        ))
+
+    keys_in_use = sublime_util.keycounter - len(sublime_util.keypool)
+    lines.append("{:<20} {:>6} in use, {} pooled".format(
+        "hidden region keys", keys_in_use, len(sublime_util.keypool)
+    ))
+
+    return '\n'.join(lines) + '\n'
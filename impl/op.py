@@ -1,21 +1,35 @@
 import sublime
+import time
 
 from functools import partial
 from itertools import starmap
 from sublime import Region
 
+from .common import iterate_nested
 from .common import method_for
 from .common import pairwise
+from .common import postorder
 from .common import tracking_last
 from .ds import Arg
 from .ds import Arglist
+from .layout import arg_flat_size
+from .layout import flat_size
+from .layout import replacements_for_fit
+from .layout import subarglists
 from .parse import parse_at
+from .parse_cache import invalidate as invalidate_parse_cache
+from .plan_cache import cache_for as plan_cache_for
 from .shared import Scope
 from .shared import cxt
+from .sublime_util import add_hidden_regions
 from .sublime_util import col_at
+from .sublime_util import erase_hidden_regions
+from .sublime_util import get_hidden_regions
 from .sublime_util import indentation_at
 from .sublime_util import is_at_indent_start
 from .sublime_util import is_reg_multilined
+from .sublime_util import key_acquire
+from .sublime_util import key_release
 from .sublime_util import line_ruler_pos
 from .sublime_util import on_same_line
 from .sublime_util import relocating_posns
@@ -23,6 +37,7 @@ from .sublime_util import row_at
 from .sublime_util import row_rstrip_pos
 from .sublime_util import rstrip_pos
 from .sublime_util import substr_row_line
+from .sublime_util import ws_end_after
 
 
 @method_for(Arglist)
@@ -57,7 +72,7 @@ def has_arg_starting_below_row1(self):
 
 def split_all_at(edit, posns):
     for pos in relocating_posns(cxt.view, posns):
-        perform_replacements(edit, replacements_for_split_at(pos))
+        perform_replacements(edit, planned('split', pos, replacements_for_split_at))
 
 
 def replacements_for_split_at(pos):
@@ -91,7 +106,8 @@ def is_on_fresh_line(self):
 
 @method_for(Arglist)
 def sub_arg(self, sub):
-    return next(arg for arg in self.args if sub in arg.arglists)
+    # Compare by position: self and sub may come from different parses
+    return next(arg for arg in self.args if arg.begin <= sub.begin and sub.end <= arg.end)
 
 
 @method_for(Arglist)
@@ -212,6 +228,8 @@ def perform_replacements(edit, replacements):
             del sel[fix_idx]
             sel.add(reg.begin())
 
+    invalidate_parse_cache(cxt.view)
+
 
 def split_all_if_too_long(edit, posns):
     for pos in relocating_posns(cxt.view, posns):
@@ -224,6 +242,10 @@ def replacements_for_split_if_too_long(pos):
     Current logic is: find the outermost arglist E starting on same line, and its parent
     P. If P's arg containing E does not start on a fresh line, then split P across
     multiple lines. In all other cases, split E as much as needed.
+
+    The arglist being split is laid out together with its descendants so that all of
+    its lines fit the ruler at once (see layout.py), unless it has unerasable
+    linebreaks. Then it is split just one step.
     """
     offending_pos = line_ruler_pos(cxt.view, pos, cxt.ruler)
     if offending_pos is None:
@@ -236,7 +258,7 @@ def replacements_for_split_if_too_long(pos):
         return
 
     if row_at(cxt.view, E.begin) < offending_row:
-        yield from E.split_multi()
+        yield from E.split_to_fit_all(E.split_multi)
         return
 
     P = None
@@ -254,11 +276,19 @@ def replacements_for_split_if_too_long(pos):
     if P is not None:
         arg = P.sub_arg(E)
         if not arg.is_on_fresh_line():
-            yield from P.split_multi()
+            yield from P.split_to_fit_all(P.split_multi)
             return
 
     if E.args:
-        yield from E.split_to_fit()
+        yield from E.split_to_fit_all(E.split_to_fit)
+
+
+@method_for(Arglist)
+def split_to_fit_all(self, split_one_step):
+    if self.has_unerasable_linebreak():
+        yield from split_one_step()
+    else:
+        yield from replacements_for_fit(self, grow_only=True)
 
 
 @method_for(Arglist)
@@ -284,7 +314,7 @@ def split_to_fit(self):
 
 def join_all_at(edit, posns):
     for pos in relocating_posns(cxt.view, posns):
-        perform_replacements(edit, replacements_for_join_at(pos))
+        perform_replacements(edit, planned('join', pos, replacements_for_join_at))
 
 
 def replacements_for_join_at(pos):
@@ -295,13 +325,128 @@ def replacements_for_join_at(pos):
     yield from replacements_by_join_spec(join_spec)
 
 
+PLANNERS = {
+    'split': replacements_for_split_at,
+    'join': replacements_for_join_at,
+}
+
+
+def plan_state():
+    return cxt.view.change_count(), cxt.ruler, cxt.tab_size
+
+
+def planned(kind, pos, replacements_for):
+    """Replacements of kind at pos: the precomputed plan if fresh, or computed now"""
+    plan = plan_cache_for(cxt.view).get(kind, pos, plan_state())
+    return replacements_for(pos) if plan is None else plan
+
+
+def precompute_plans_at(pos, kinds=tuple(PLANNERS)):
+    """Compute replacements of kinds at pos for the commands to use later"""
+    cache = plan_cache_for(cxt.view)
+    for kind in kinds:
+        cache.put(kind, pos, plan_state(), list(PLANNERS[kind](pos)))
+
+
+def join_to_fit_all_at(edit, posns):
+    for pos in relocating_posns(cxt.view, posns):
+        perform_replacements(edit, replacements_for_join_to_fit_at(pos))
+
+
+def replacements_for_join_to_fit_at(pos):
+    """Lay out the innermost multilined arglist at pos compactly, with all descendants.
+
+    Unlike join by join spec, this does not stop at one step. Nothing is done if that
+    would not reduce the number of lines.
+    """
+    E = parse_at(pos)
+
+    while E is not None and E.is_oneliner():
+        E = E.parse_parent()
+
+    if E is None or E.has_unerasable_linebreak():
+        return []
+
+    replacements = list(replacements_for_fit(E, grow_only=False))
+    lines_added = sum(
+        rplc.count('\n') - cxt.view.substr(reg).count('\n') for reg, rplc in replacements
+    )
+
+    return replacements if lines_added < 0 else []
+
+
+def format_rows(edit, rows, deadline):
+    """Join arglists that fit and split lines past the ruler, around the given rows.
+
+    Each step is applied only if it has been computed by deadline (a time.perf_counter()
+    value), so running out of time leaves the rest of the rows untouched.
+
+    Rows are formatted bottom-up, and a row's posns are found only when it's reached: the
+    rows above every edit made so far keep their numbers. Rows an edit is about to reach
+    are turned into posns first, which are tracked through the edits.
+
+    :return: the number of rows left unformatted
+    """
+    rows = sorted(set(rows))
+    steps = (replacements_for_join_to_fit_at, replacements_for_split_if_too_long)
+    key = key_acquire()
+
+    def tracked():
+        return [reg.b for reg in get_hidden_regions(cxt.view, key)]
+
+    def track(posns):
+        add_hidden_regions(cxt.view, key, [Region(pos) for pos in sorted(posns)])
+
+    def rows_left():
+        return len(rows) + (len(tracked()) + 1) // 2
+
+    def row_line(row):
+        return cxt.view.line(cxt.view.text_point(row, 0))
+
+    def row_posns(row):
+        line_reg = row_line(row)
+        # The row's first and last chars, to reach arglists it opens, closes or is in
+        return [
+            ws_end_after(cxt.view, line_reg.begin()), rstrip_pos(cxt.view, line_reg.end())
+        ]
+
+    try:
+        while rows or tracked():
+            if not tracked():
+                track(row_posns(rows.pop()))
+
+            for step in steps:
+                if time.perf_counter() > deadline:
+                    return rows_left()
+
+                replacements = list(step(tracked()[-1]))
+                if time.perf_counter() > deadline:
+                    return rows_left()
+
+                if replacements:
+                    begin = min(reg.begin() for reg, rplc in replacements)
+                    posns = tracked()
+                    while rows and row_line(rows[-1]).end() >= begin:
+                        posns.extend(row_posns(rows.pop()))
+                    track(posns)
+
+                perform_replacements(edit, replacements)
+
+            track(tracked()[:-1])
+
+        return 0
+    finally:
+        erase_hidden_regions(cxt.view, key)
+        key_release(key)
+
+
 def replacements_by_join_spec(join_spec):
     E, row, full = join_spec
 
     if row == 0:
-        yield from E.replacements_for_join(full=full)
+        yield from iterate_nested(E.replacements_for_join(full=full))
     elif row == 1:
-        yield from E.replacements_for_join_to_row1(full=full)
+        yield from iterate_nested(E.replacements_for_join_to_row1(full=full))
     else:
         raise RuntimeError
 
@@ -393,15 +538,17 @@ def join_col1(self):
 
 @method_for(Arglist)
 def has_unerasable_linebreak(self):
-    return any(arg.has_unerasable_linebreak() for arg in self.args)
+    return any(
+        arg.has_linebreak_outside_arglists()
+        for arglist in postorder(self, subarglists)
+        for arg in arglist.args
+    )
 
 
 @method_for(Arg)
-def has_unerasable_linebreak(self):
-    return (
-        any(is_reg_multilined(cxt.view, reg)
-            for reg in self.regions_outside_arglists()) or
-        any(arglist.has_unerasable_linebreak() for arglist in self.arglists)
+def has_linebreak_outside_arglists(self):
+    return any(
+        is_reg_multilined(cxt.view, reg) for reg in self.regions_outside_arglists()
     )
 
 
@@ -419,6 +566,7 @@ def regions_outside_arglists(self):
 
 @method_for(Arglist)
 def replacements_for_join(self, full=True):
+    """Generate replacements, to be run with 'iterate_nested'"""
     prev = self.open
     rplc = ''
 
@@ -437,11 +585,12 @@ def replacements_for_join(self, full=True):
 @method_for(Arg)
 def replacements_for_join(self):
     for arglist in self.arglists:
-        yield from arglist.replacements_for_join()
+        yield arglist.replacements_for_join()
 
 
 @method_for(Arglist)
 def replacements_for_join_to_row1(self, full=True):
+    """Generate replacements, to be run with 'iterate_nested'"""
     ind0 = indentation_at(cxt.view, self.begin)
     
     yield from pushdown(self.open, self.args[0].begin, ind0 + cxt.tab_size)
@@ -470,21 +619,20 @@ def replacements_for_dedent(self):
 
 @method_for(Arglist)
 def min_int_size(self):
-    spaces_between = max(0, len(self.args) - 1)
-    return spaces_between + sum(arg.min_size() for arg in self.args)
+    return self.min_size() - 2
 
 
 @method_for(Arglist)
 def min_size(self):
-    return self.min_int_size() + 2
+    return flat_size(self)
 
 
 @method_for(Arg)
 def min_size(self):
-    return (
-        sum(reg.size() for reg in self.regions_outside_arglists()) +
-        sum(arglist.min_size() for arglist in self.arglists)
-    )
+    for arglist in self.arglists:
+        flat_size(arglist)
+
+    return arg_flat_size(self)
 
 
 @method_for(Arglist)
@@ -544,38 +692,45 @@ def mark_all_joinables_at(posns):
     arrow_posns = set()
 
     for pos in posns:
-        join_spec = what_to_join_at(pos)
-        if join_spec is None:
-            continue
+        mark_joinable_at(pos, arrow_posns)
+
+
+def mark_joinable_at(pos, arrow_posns):
+    """Show an arrow if the arglist at pos is joinable, unless one is at arrow_posns"""
+    join_spec = what_to_join_at(pos)
+    if join_spec is None:
+        return
 
-        E, row, full = join_spec
+    E, row, full = join_spec
 
-        if row == 0:
-            arrow = '\u2191' if full else '\u21e1'
-            arrow_pos = rstrip_pos(cxt.view, E.begin)
+    if row == 0:
+        arrow = '\u2191' if full else '\u21e1'
+        arrow_pos = rstrip_pos(cxt.view, E.begin)
+    else:
+        row1 = row_at(cxt.view, E.begin) + 1
+        if substr_row_line(cxt.view, row1).strip():
+            arrow = '\u2190' if full else '\u21e0'
+            arrow_pos = row_rstrip_pos(cxt.view, row1)
         else:
-            row1 = row_at(cxt.view, E.begin) + 1
-            if substr_row_line(cxt.view, row1).strip():
-                arrow = '\u2190' if full else '\u21e0'
-                arrow_pos = row_rstrip_pos(cxt.view, row1)
-            else:
-                # row 1 is all spaces or empty, so don't show an arrow since it would look
-                # ugly
-                continue                
-
-        if arrow_pos not in arrow_posns:
-            def dojoin(view, href):
-                [reg] = view.query_phantom(dojoin.phid)
-                view.run_command('autosplit_join', {'at': reg.begin()})
-
-            phid = cxt.view.add_phantom(
-                'autosplit:joinable',
-                Region(arrow_pos),
-                ARROW_PHANTOM.format(arrow),
-                sublime.LAYOUT_INLINE,
-                partial(dojoin, cxt.view)
-            )
-            dojoin.phid = phid
+            # row 1 is all spaces or empty, so don't show an arrow since it would look
+            # ugly
+            return
+
+    if arrow_pos not in arrow_posns:
+        arrow_posns.add(arrow_pos)
+
+        def dojoin(view, href):
+            [reg] = view.query_phantom(dojoin.phid)
+            view.run_command('autosplit_join', {'at': reg.begin()})
+
+        phid = cxt.view.add_phantom(
+            'autosplit:joinable',
+            Region(arrow_pos),
+            ARROW_PHANTOM.format(arrow),
+            sublime.LAYOUT_INLINE,
+            partial(dojoin, cxt.view)
+        )
+        dojoin.phid = phid
 
 
 ARROW_PHANTOM = '''
@@ -1,11 +1,18 @@
+import re
 import sublime
 
 from collections import deque
+from functools import partial
+from heapq import merge
 from itertools import chain
 
 from . import ds
+from .arglist_index import NO_ARGLIST
+from .arglist_index import fresh_index
+from .parse_cache import cache_for
 from .shared import Scope
 from .shared import cxt
+from .sublime_util import indentation_at
 from .sublime_util import ws_begin_before
 from .sublime_util import ws_end_after
 from .common import method_for
@@ -79,20 +86,87 @@ def extract_token(pos):
     return reg_scope
 
 
-def tokens_leftwards(pos):
+class TokenBudget:
+    """How many more tokens one parse may scan before giving up"""
+
+    def __init__(self):
+        self.left = cxt.settings.get('max_scan_tokens') or float('inf')
+
+    def spend(self):
+        self.left -= 1
+        return self.left >= 0
+
+
+# Statements that can't start a line inside parens
+STATEMENT_KEYWORDS = {
+    'assert', 'break', 'class', 'continue', 'def', 'del', 'elif', 'except', 'finally',
+    'global', 'import', 'nonlocal', 'pass', 'raise', 'return', 'try', 'while', 'with'
+}
+
+
+def is_statement_boundary(line_reg, indent):
+    """Whether line_reg can't be inside an arglist opened on a line indented by indent.
+
+    While a paren is unbalanced, the syntax takes the rest of the file for arguments.
+    Lines that are dedented past the call, or that start a statement, tell that the
+    paren is unbalanced so that the scan can stop early.
+    """
+    text = cxt.view.substr(line_reg)
+    stripped = text.lstrip()
+    if not stripped or stripped[0] in ')]}#':
+        return False
+
+    col = len(text) - len(stripped)
+    word = re.match(r'\w*', stripped).group()
+    if not (indent is not None and col < indent or word in STATEMENT_KEYWORDS):
+        return False
+
+    # Lines of multiline strings are not code
+    return not cxt.view.match_selector(line_reg.begin() + col, 'string')
+
+
+def tokens_leftwards(pos, budget):
+    """Arglist tokens to the left of pos.
+
+    A line that starts a statement may still open the arglist (as in 'return f('), so
+    the scan stops past such a line rather than before it.
+    """
+    line_reg = cxt.view.line(pos)
+
     while pos > 0:
         reg, scope = extract_token(pos - 1)
-        if not is_arglist(scope):
+        if not is_arglist(scope) or not budget.spend():
             break
+
+        if reg.begin() < line_reg.begin():
+            if is_statement_boundary(line_reg, None):
+                break
+            line_reg = cxt.view.line(reg.begin())
+
         pos = reg.begin()
         yield reg, scope
 
 
-def tokens_rightwards(pos):
+def tokens_rightwards(pos, budget, indent=None):
+    """Arglist tokens to the right of pos.
+
+    :param indent: indentation of the line with the opening paren of the outermost
+        arglist being parsed (if known), to stop at lines dedented past it
+    """
+    line_end = cxt.view.line(pos).end()
+
     while pos < cxt.view.size():
         reg, scope = extract_token(pos)
-        if not is_arglist(scope):
+        if not is_arglist(scope) or not budget.spend():
             break
+
+        if reg.begin() > line_end:
+            line_reg = cxt.view.line(reg.begin())
+            line_end = line_reg.end()
+            if (ws_end_after(cxt.view, line_reg.begin()) >= reg.begin() and
+                    is_statement_boundary(line_reg, indent)):
+                break
+
         pos = reg.end()
         yield reg, scope
 
@@ -156,20 +230,48 @@ def parse_at(pos):
     if token0 is None:
         return None
 
-    reg0 = token0[0]
+    known = cached_or_indexed(pos, pos)
+    if known is not None:
+        return None if known == NO_ARGLIST else known
 
-    gtor_left = chain([token0], tokens_leftwards(reg0.begin()))
-    gtor_right = tokens_rightwards(reg0.end())
+    reg0 = token0[0]
+    budget = TokenBudget()
 
     enc = Arglist()
 
     try:
-        parse_left(enc, gtor_left)
-        parse_right(enc, gtor_right)
+        parse_left(enc, chain([token0], tokens_leftwards(reg0.begin(), budget)))
+        indent = indentation_at(cxt.view, enc.open)
+        parse_right(enc, tokens_rightwards(reg0.end(), budget, indent))
     except StopIteration:
         return None
 
-    return enc.complete()
+    arglist = enc.complete()
+    cache_for(cxt.view).put(arglist, cxt.view.change_count())
+    return arglist
+
+
+def cached_or_indexed(begin, end):
+    """Innermost arglist enclosing begin..end, if the parse cache or the index knows it.
+
+    Return NO_ARGLIST if the index knows there's none, or None if neither can tell.
+    """
+    cache = cache_for(cxt.view)
+    cached = cache.enclosing(begin, end, cxt.view.change_count())
+    if cached is not None:
+        return cached
+
+    index = fresh_index(cxt.view)
+    if index is None:
+        return None
+
+    i = index.innermost(begin, end)
+    if i is None or i == NO_ARGLIST:
+        return i
+
+    arglist = indexed_arglist(index, i, cxt.view)
+    cache.put(arglist, cxt.view.change_count())
+    return arglist
 
 
 @method_for(Arglist)
@@ -177,28 +279,40 @@ def complete(self):
     """Produce complete ds.Arglist instance from the incomplete parser-level Arglist.
 
     The job is to find missing information (e.g. beginnings of arguments) that could not
-    be found while parsing.
+    be found while parsing. This is done lazily, when args of the complete arglist are
+    first accessed, so that nested arglists nobody looks at cost nothing. Completing
+    a level only wraps the nested arglists, so arbitrarily deep nesting causes no
+    recursion.
     """
+    return ds.Arglist(
+        open=self.open,
+        close=self.close,
+        find_args=partial(self.complete_args, cxt.view)
+    )
+
+
+@method_for(Arglist)
+def complete_args(self, view):
     complete_args = []
     prev = self.open
 
     for arg in self.args:
         complete_args.append(ds.Arg(
-            begin=ws_end_after(cxt.view, prev),
+            begin=ws_end_after(view, prev),
             end=arg.comma + 1 if arg.comma else None,
             arglists=[al.complete() for al in arg.arglists]
         ))
         prev = complete_args[-1].end
 
     if prev is not None:
-        begin = ws_end_after(cxt.view, prev)
-        end = ws_begin_before(cxt.view, self.close)
+        begin = ws_end_after(view, prev)
+        end = ws_begin_before(view, self.close)
         if begin < end:
             complete_args.append(ds.Arg(begin=begin, end=end))
     else:
-        complete_args[-1].end = ws_begin_before(cxt.view, self.close)
+        complete_args[-1].end = ws_begin_before(view, self.close)
 
-    return ds.Arglist(open=self.open, close=self.close, args=complete_args)
+    return complete_args
 
 
 @method_for(ds.Arglist)
@@ -210,16 +324,45 @@ def complete(self):
 @method_for(ds.Arglist)
 def parse_parent(self):
     """Parse enclosing arglist of self"""
-    gtor_left = tokens_leftwards(self.begin)
-    gtor_right = tokens_rightwards(self.end)
+    known = cached_or_indexed(self.begin, self.end)
+    if known is not None:
+        return None if known == NO_ARGLIST else known
+
+    budget = TokenBudget()
 
     enc = Arglist()
     enc.append_subarglist_right(self)  # _left could have worked equally well
 
     try:
-        parse_left(enc, gtor_left)
-        parse_right(enc, gtor_right)
+        parse_left(enc, tokens_leftwards(self.begin, budget))
+        indent = indentation_at(cxt.view, enc.open)
+        parse_right(enc, tokens_rightwards(self.end, budget, indent))
     except StopIteration:
         return None
 
-    return enc.complete()
+    arglist = enc.complete()
+    cache_for(cxt.view).put(arglist, cxt.view.change_count())
+    return arglist
+
+
+def indexed_arglist(index, i, view):
+    """Complete arglist i of the arglist index, its args found on first access"""
+    return ds.Arglist(
+        open=index.opens[i],
+        close=index.closes[i],
+        find_args=partial(indexed_args, index, i, view)
+    )
+
+
+def indexed_args(index, i, view):
+    arglist = Arglist(open=index.opens[i], close=index.closes[i])
+    subs = [indexed_arglist(index, j, view) for j in index.children_of(i)]
+
+    for pos, sub in merge(((comma, None) for comma in index.commas_of(i)),
+                          ((sub.open, sub) for sub in subs)):
+        if sub is None:
+            arglist.append_comma_right(pos)
+        else:
+            arglist.append_subarglist_right(sub)
+
+    return arglist.complete_args(view)
@@ -0,0 +1,91 @@
+"""Per-buffer LRU cache of complete arglists (ds.Arglist trees).
+
+Within one editing burst the same arglist gets parsed several times: for auto-split,
+for arrows, for the split/join commands. Entries are keyed by the offset of the
+opening paren and the buffer's change count, so any modification makes all of them
+stale. Since a cached tree is complete, the innermost arglist enclosing any position
+within it can be found without scanning tokens. Views into the same buffer (clones)
+share the cache.
+"""
+from collections import OrderedDict
+
+
+CACHE_SIZE = 16
+
+
+class ArglistCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()  # (open, change_count) -> ds.Arglist
+        self.change_count = None
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self, change_count):
+        if change_count != self.change_count:
+            self.entries.clear()
+            self.change_count = change_count
+
+    def put(self, arglist, change_count):
+        self._sync(change_count)
+        key = arglist.open, change_count
+        self.entries[key] = arglist
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def enclosing(self, begin, end, change_count):
+        """Innermost cached arglist A such that A.open <= begin and end <= A.close"""
+        self._sync(change_count)
+
+        found = None
+        for key, arglist in self.entries.items():
+            if (arglist.open <= begin and end <= arglist.close and
+                    (found is None or found[1].open < arglist.open)):
+                found = key, arglist
+
+        if found is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(found[0])
+        return descend(found[1], begin, end)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def descend(arglist, begin, end):
+    while True:
+        sub = next(
+            (sub for arg in arglist.args for sub in arg.arglists
+             if sub.open <= begin and end <= sub.close),
+            None
+        )
+        if sub is None:
+            return arglist
+
+        arglist = sub
+
+
+caches = {}  # view.buffer_id() -> ArglistCache
+
+
+def cache_for(view):
+    cache = caches.get(view.buffer_id())
+    if cache is None:
+        cache = caches[view.buffer_id()] = ArglistCache()
+
+    return cache
+
+
+def invalidate(view):
+    cache = caches.get(view.buffer_id())
+    if cache is not None:
+        cache.clear()
+
+
+def forget(view):
+    caches.pop(view.buffer_id(), None)
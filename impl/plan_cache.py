@@ -0,0 +1,52 @@
+"""Per-buffer cache of split/join plans computed ahead of time.
+
+While the user is idle, the replacements that the split and join commands would
+perform at each cursor are computed and stored here, so that the commands can apply
+them right away. Plans are valid for one state of the buffer and its settings: the
+change count, the ruler and the tab size. Any modification makes all of them stale.
+
+Commands with several cursors apply the plan of each cursor in turn; once one of them
+has changed the buffer, the plans for the rest are stale and get recomputed.
+"""
+
+
+class PlanCache:
+    def __init__(self):
+        self.state = None  # (change_count, ruler, tab_size) the plans are valid for
+        self.plans = {}  # (kind, pos) -> [(Region, str)]
+        self.hits = 0
+        self.misses = 0
+
+    def _sync(self, state):
+        if state != self.state:
+            self.plans.clear()
+            self.state = state
+
+    def put(self, kind, pos, state, replacements):
+        self._sync(state)
+        self.plans[kind, pos] = replacements
+
+    def get(self, kind, pos, state):
+        """Return the plan of kind at pos, or None if there's none or it's stale"""
+        self._sync(state)
+        plan = self.plans.get((kind, pos))
+        if plan is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return plan
+
+
+caches = {}  # view.buffer_id() -> PlanCache
+
+
+def cache_for(view):
+    cache = caches.get(view.buffer_id())
+    if cache is None:
+        cache = caches[view.buffer_id()] = PlanCache()
+
+    return cache
+
+
+def forget(view):
+    caches.pop(view.buffer_id(), None)
@@ -0,0 +1,143 @@
+"""Capturing cProfile profiles of the plugin from inside the editor.
+
+A capture session instruments the given classes (the plugin's commands and listener)
+by replacing their methods with profiling wrappers, and puts the originals back once
+the requested number of invocations have run. Outside of a session nothing is
+instrumented, so there's no overhead at all.
+"""
+import cProfile
+import inspect
+import io
+import os
+import pstats
+import sublime
+import time
+
+from functools import wraps
+from types import GeneratorType
+
+
+PANEL_NAME = 'autosplit_profile'
+
+# Modules that the summary breaks the time down by
+SUMMARY_MODULES = ('parse', 'op', 'sublime_util')
+SUMMARY_LIMIT = 30
+
+
+class Session:
+    def __init__(self, window, invocations, targets):
+        self.window = window
+        self.left = invocations
+        self.invocations = 0
+        self.profile = cProfile.Profile()
+        self.depth = 0  # nesting of instrumented calls (only outermost ones count)
+        self.originals = []  # [(class, name, function)]
+        self.instrument(targets)
+
+    def instrument(self, targets):
+        for klass in targets:
+            for name, fn in list(vars(klass).items()):
+                if inspect.isfunction(fn) and not name.startswith('_'):
+                    self.originals.append((klass, name, fn))
+                    setattr(klass, name, self.wrap(fn))
+
+    def restore(self):
+        for klass, name, fn in self.originals:
+            setattr(klass, name, fn)
+        self.originals = []
+
+    def wrap(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            res = self.call(fn, args, kwargs)
+            if isinstance(res, GeneratorType):
+                # Scheduler jobs do their work when resumed
+                res = self.wrap_gtor(res)
+            return res
+
+        return wrapper
+
+    def wrap_gtor(self, gtor):
+        try:
+            while True:
+                try:
+                    item = self.call(next, (gtor,), {})
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            gtor.close()
+
+    def call(self, fn, args, kwargs):
+        if self.depth > 0 or self.left <= 0:
+            return fn(*args, **kwargs)
+
+        self.depth += 1
+        self.profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.profile.disable()
+            self.depth -= 1
+            self.invocations += 1
+            self.left -= 1
+            if self.left == 0:
+                # Stop right away, but report outside of the plugin code being profiled
+                self.restore()
+                sublime.set_timeout(finish, 0)
+
+
+session = None
+
+
+def start(window, invocations, targets):
+    global session
+    session = Session(window, invocations, targets)
+
+
+def is_capturing():
+    return session is not None
+
+
+def finish():
+    """End the session (if still on), save the profile and show the summary"""
+    global session
+
+    if session is None:
+        return
+
+    ended, session = session, None
+    ended.restore()
+
+    folder = os.path.join(sublime.cache_path(), 'AutoSplit')
+    os.makedirs(folder, exist_ok=True)
+    name = 'profile-{}.pstats'.format(time.strftime('%Y%m%d-%H%M%S'))
+    path = os.path.join(folder, name)
+    ended.profile.dump_stats(path)
+
+    panel = ended.window.create_output_panel(PANEL_NAME)
+    panel.run_command('append', {'characters': summary(ended, path)})
+    ended.window.run_command('show_panel', {'panel': 'output.' + PANEL_NAME})
+
+
+def summary(ended, path):
+    out = io.StringIO()
+    stats = pstats.Stats(ended.profile, stream=out)
+
+    print("AutoSplit profile of {} invocations, saved to {}\n".format(
+        ended.invocations, path
+    ), file=out)
+
+    own_times = dict.fromkeys(SUMMARY_MODULES + ('other',), 0.0)
+    for (filename, lineno, funcname), (cc, nc, tt, ct, callers) in stats.stats.items():
+        module = os.path.splitext(os.path.basename(filename))[0]
+        own_times[module if module in own_times else 'other'] += tt
+
+    print("Own time by module:", file=out)
+    for module, t in own_times.items():
+        print("  {:<15} {:9.3f}s".format(module, t), file=out)
+    print(file=out)
+
+    pattern = r'[\\/]impl[\\/]({})\.py'.format('|'.join(SUMMARY_MODULES))
+    stats.sort_stats('cumulative').print_stats(pattern, SUMMARY_LIMIT)
+    return out.getvalue()
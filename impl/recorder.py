@@ -0,0 +1,144 @@
+"""Recording editing sessions, for replaying them outside of Sublime Text.
+
+A recording is a JSON-lines file. The first entry holds the view's initial text,
+selection and settings; the following ones are the events AutoSplit reacts to:
+user edits, selection changes and AutoSplit commands. Edits that AutoSplit makes
+itself are not recorded, as replaying the session reproduces them. See replay.py.
+"""
+import json
+import os
+import sublime
+import time
+
+
+# View settings and AutoSplit settings that affect the behavior
+VIEW_SETTINGS = ('rulers', 'tab_size', 'translate_tabs_to_spaces', 'show_arrows')
+PLUGIN_SETTINGS = (
+    'show_arrows', 'show_violation_count', 'auto_split_delay_ms', 'latency_budget_ms',
+    'latency_strikes', 'format_on_save', 'format_on_save_budget_ms', 'max_scan_tokens'
+)
+
+# Commands recorded as such (their edits are then AutoSplit's own)
+RECORDED_COMMANDS = {
+    'autosplit_split', 'autosplit_join', 'autosplit_join_to_fit',
+    'autosplit_goto_violation', 'autosplit_restore_features'
+}
+
+STATUS_KEY = 'autosplit_recording'
+
+
+class Recorder:
+    def __init__(self, view, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+        self.started = time.perf_counter()
+        self.text = whole_text(view)
+        self.sel = selection_of(view)
+
+        plugin_settings = sublime.load_settings('AutoSplit.sublime-settings')
+        self.write(
+            'start',
+            text=self.text,
+            sel=self.sel,
+            settings={key: view.settings().get(key) for key in VIEW_SETTINGS},
+            plugin_settings={key: plugin_settings.get(key) for key in PLUGIN_SETTINGS}
+        )
+
+    def write(self, kind, **data):
+        data['kind'] = kind
+        data['t'] = round(time.perf_counter() - self.started, 4)
+        self.file.write(json.dumps(data) + '\n')
+        self.file.flush()
+
+    def note_modified(self, view, is_own):
+        """Record the user's modification as the edit between the old and new text.
+
+        Edits of the recorded commands are skipped: they are not made in transactions
+        (they have an edit of their own), and replaying the command redoes them.
+        """
+        text = whole_text(view)
+        cmd, args, repeat = view.command_history(0)
+        if not is_own and cmd not in RECORDED_COMMANDS:
+            begin, end, new_end = text_diff(self.text, text)
+            self.write(
+                'edit', begin=begin, end=end, chars=text[begin:new_end], cmd=cmd,
+                args=args
+            )
+        self.text = text
+
+    def note_selection(self, view):
+        sel = selection_of(view)
+        if sel != self.sel:
+            self.write('selection', sel=sel)
+            self.sel = sel
+
+    def note_command(self, cmd, args):
+        if cmd in RECORDED_COMMANDS:
+            self.write('command', cmd=cmd, args=args)
+
+    def close(self):
+        self.write('stop', text=self.text)
+        self.file.close()
+
+
+recorders = {}  # view.id() -> Recorder
+
+
+def recorder_for(view):
+    return recorders.get(view.id())
+
+
+def start(view):
+    folder = os.path.join(sublime.cache_path(), 'AutoSplit', 'sessions')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(
+        folder, '{}-{}.jsonl'.format(time.strftime('%Y%m%d-%H%M%S'), view.id())
+    )
+    recorders[view.id()] = Recorder(view, path)
+    view.set_status(STATUS_KEY, 'AutoSplit: recording')
+    return path
+
+
+def stop(view):
+    """Stop recording the view, return the path of the recording (or None)"""
+    rec = recorders.pop(view.id(), None)
+    if rec is None:
+        return None
+
+    rec.close()
+    view.erase_status(STATUS_KEY)
+    return rec.path
+
+
+def whole_text(view):
+    return view.substr(sublime.Region(0, view.size()))
+
+
+def selection_of(view):
+    return [[reg.a, reg.b] for reg in view.sel()]
+
+
+def text_diff(old, new):
+    """Minimal single edit turning old into new: (begin, end, new_end).
+
+    old[begin:end] is replaced with new[begin:new_end].
+    """
+    n = min(len(old), len(new))
+    begin = common_length(lambda k: old[:k] == new[:k], n)
+    tail = common_length(lambda k: old[len(old) - k:] == new[len(new) - k:], n - begin)
+    return begin, len(old) - tail, len(new) - tail
+
+
+def common_length(is_common, limit):
+    """Greatest k <= limit such that is_common(k), for a monotonic is_common.
+
+    Slices are compared in C, so this is much faster than a char-by-char loop.
+    """
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if is_common(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
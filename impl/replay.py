@@ -0,0 +1,260 @@
+"""Replaying sessions recorded with the autosplit_toggle_recording command.
+
+    python -m AutoSplit.impl.replay SESSION.jsonl [--events] [--json] [--no-wait]
+                                                  [--text FILE]
+
+The session runs against headless.View with the plugin's listener and commands.
+Every event is timed, and the View API calls that the plugin makes while handling it
+are counted. Timer callbacks (debounced arrows, deferred splits) are reported as
+events of their own. Exits with status 1 if the final text differs from the recorded
+one, so that a recording can serve as a regression test.
+
+Pauses between events are reproduced (up to MAX_GAP seconds each), so that debounced
+work runs as it did in the editor. With --no-wait, events follow each other
+immediately and timers only run at the end.
+"""
+from . import headless
+
+import argparse
+import json
+import sublime
+import sys
+import time
+
+from collections import Counter
+
+from .headless.view import View
+
+
+MAX_GAP = 1.0  # longest pause between events that is reproduced, in seconds
+SLOWEST_SHOWN = 10
+
+
+class CountingView(View):
+    """View that counts the API calls that the plugin makes on it"""
+
+    def __init__(self, *args, **kwargs):
+        self.api_calls = Counter()
+        super().__init__(*args, **kwargs)
+
+
+def counting(name, method):
+    def wrapper(self, *args, **kwargs):
+        if self._plugin_depth == 0 or self._in_api:
+            return method(self, *args, **kwargs)
+
+        self.api_calls[name] += 1
+        self._in_api = True
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._in_api = False
+
+    return wrapper
+
+
+for name, method in list(vars(View).items()):
+    if callable(method) and not name.startswith('_'):
+        setattr(CountingView, name, counting(name, method))
+
+
+class Event:
+    def __init__(self, index, kind, what, ms, api_calls):
+        self.index = index
+        self.kind = kind
+        self.what = what
+        self.ms = ms
+        self.api_calls = api_calls
+
+    def as_dict(self):
+        return {
+            'index': self.index,
+            'kind': self.kind,
+            'what': self.what,
+            'ms': round(self.ms, 3),
+            'api_calls': dict(self.api_calls),
+        }
+
+
+class Replay:
+    def __init__(self, entries, wait):
+        self.entries = entries
+        self.wait = wait
+        self.events = []
+
+        headless.load_plugin()
+        start = entries[0]
+        plugin_settings = sublime.load_settings('AutoSplit.sublime-settings')
+        for key, value in start['plugin_settings'].items():
+            plugin_settings.set(key, value)
+
+        self.view = CountingView(start['text'], settings=start['settings'])
+        self.view.set_selection(regions(start['sel']))
+
+    def run(self):
+        prev_t = self.entries[0]['t']
+
+        for index, entry in enumerate(self.entries[1:], 1):
+            gap = min(entry['t'] - prev_t, MAX_GAP) if self.wait else 0
+            prev_t = entry['t']
+            self.run_timers(time.perf_counter() + gap)
+
+            if entry['kind'] == 'stop':
+                break
+
+            self.measure(index, entry['kind'], describe(entry), lambda: self.apply(entry))
+
+        self.run_timers(float('inf'))
+
+    def apply(self, entry):
+        view = self.view
+        kind = entry['kind']
+
+        if kind == 'edit':
+            reg = sublime.Region(entry['begin'], entry['end'])
+            view.apply_user_edit(reg, entry['chars'], entry['cmd'], entry['args'])
+        elif kind == 'selection':
+            view.set_selection(regions(entry['sel']))
+        elif kind == 'command':
+            view.run_command(entry['cmd'], entry['args'])
+        else:
+            raise ValueError("Unknown event kind: {}".format(kind))
+
+    def run_timers(self, deadline):
+        while True:
+            callback = sublime.pop_due_timer(deadline)
+            if callback is None:
+                break
+
+            def run_callback():
+                with self.view.running_plugin_code():
+                    callback()
+
+            self.measure(None, 'timer', '', run_callback)
+
+        if deadline != float('inf'):
+            time.sleep(max(0, deadline - time.perf_counter()))
+
+    def measure(self, index, kind, what, thunk):
+        self.view.api_calls.clear()
+        start = time.perf_counter()
+        thunk()
+        ms = (time.perf_counter() - start) * 1000
+        self.events.append(Event(index, kind, what, ms, Counter(self.view.api_calls)))
+
+    @property
+    def final_text(self):
+        return self.view.substr(sublime.Region(0, self.view.size()))
+
+    @property
+    def recorded_text(self):
+        last = self.entries[-1]
+        return last['text'] if last['kind'] == 'stop' else None
+
+
+def regions(sel):
+    return [sublime.Region(a, b) for a, b in sel]
+
+
+def describe(entry):
+    kind = entry['kind']
+    if kind == 'edit':
+        return '{} {!r}'.format(entry['cmd'], entry['chars'][:20])
+    elif kind == 'command':
+        return entry['cmd']
+    else:
+        return '{} cursor(s)'.format(len(entry['sel']))
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+
+    if not entries or entries[0]['kind'] != 'start':
+        raise ValueError("{} is not an AutoSplit session recording".format(path))
+
+    return entries
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def print_event(ev, file):
+    print('{:>6} {:<10} {:<30} {:>9.2f} {:>9}'.format(
+        '' if ev.index is None else ev.index, ev.kind, ev.what, ev.ms,
+        sum(ev.api_calls.values())
+    ), file=file)
+
+
+def print_report(replay, path, show_events, file=sys.stdout):
+    events = replay.events
+    latencies = sorted(ev.ms for ev in events)
+    duration = replay.entries[-1]['t'] - replay.entries[0]['t']
+
+    print("Replayed {}: {} events over {:.1f} s of recorded editing".format(
+        path, len(events), duration
+    ), file=file)
+    print("Latency, ms: median {:.2f}, p95 {:.2f}, max {:.2f}, total {:.1f}".format(
+        percentile(latencies, 0.5), percentile(latencies, 0.95),
+        latencies[-1] if latencies else 0.0, sum(latencies)
+    ), file=file)
+
+    header = '{:>6} {:<10} {:<30} {:>9} {:>9}'.format(
+        '#', 'kind', 'what', 'ms', 'API calls'
+    )
+    if show_events:
+        print('\n' + header, file=file)
+        for ev in events:
+            print_event(ev, file)
+
+    print("\nSlowest events:\n" + header, file=file)
+    for ev in sorted(events, key=lambda ev: ev.ms, reverse=True)[:SLOWEST_SHOWN]:
+        print_event(ev, file)
+
+    api_calls = sum((ev.api_calls for ev in events), Counter())
+    print("\nAPI calls: {}".format(sum(api_calls.values())), file=file)
+    for name, n in api_calls.most_common():
+        print("  {:<30} {:>9}".format(name, n), file=file)
+
+    recorded = replay.recorded_text
+    if recorded is None:
+        verdict = "no recorded final text (recording wasn't stopped)"
+    elif recorded == replay.final_text:
+        verdict = "matches the recording"
+    else:
+        verdict = "DIFFERS from the recording"
+    print("\nFinal text: " + verdict, file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded AutoSplit session")
+    parser.add_argument('session', help="JSON-lines file written by the recorder")
+    parser.add_argument('--events', action='store_true', help="print every event")
+    parser.add_argument('--json', action='store_true', help="print events as JSON")
+    parser.add_argument('--no-wait', action='store_true',
+                        help="don't reproduce pauses between events")
+    parser.add_argument('--text', metavar='FILE', help="write the final text to FILE")
+    args = parser.parse_args(argv)
+
+    replay = Replay(load(args.session), wait=not args.no_wait)
+    replay.run()
+
+    if args.json:
+        json.dump([ev.as_dict() for ev in replay.events], sys.stdout, indent=1)
+        print()
+    else:
+        print_report(replay, args.session, args.events)
+
+    if args.text:
+        with open(args.text, 'w', encoding='utf-8') as f:
+            f.write(replay.final_text)
+
+    recorded = replay.recorded_text
+    return 0 if recorded is None or recorded == replay.final_text else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
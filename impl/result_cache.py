@@ -0,0 +1,109 @@
+"""On-disk set of files known to be already formatted, for the batch formatter.
+
+An entry is a 16-byte digest of the file's content together with everything the
+result depends on: the ruler, the tab size and the engine version (a digest of the
+engine's source). The cache file is just the entries back to back, least recently
+used first, after a short header; beyond max_entries the least recently used ones
+are dropped.
+"""
+import hashlib
+import os
+import tempfile
+
+from collections import OrderedDict
+
+
+MAGIC = b'ASRC1\n'
+DIGEST_SIZE = 16
+DEFAULT_MAX_ENTRIES = 100000
+
+# Modules whose source determines formatting results: all the batch formatter runs (the
+# engine, the headless View and the batch formatter itself), except this one
+ENGINE_MODULES = (
+    'arglist_index.py', 'batch.py', 'common.py', 'ds.py', 'edit.py', 'layout.py', 'op.py',
+    'parse.py', 'parse_cache.py', 'plan_cache.py', 'shared.py', 'sublime_util.py',
+    'headless/__init__.py', 'headless/offsets.py', 'headless/sublime.py',
+    'headless/sublime_plugin.py', 'headless/syntax.py', 'headless/view.py'
+)
+
+
+def engine_version():
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ENGINE_MODULES:
+        with open(os.path.join(here, *name.split('/')), 'rb') as f:
+            h.update(f.read())
+    return h.digest()
+
+
+def cache_key(text, ruler, tab_size, version):
+    data = text.encode('utf-8', 'surrogatepass')
+    return cache_key_of_bytes(data, ruler, tab_size, version)
+
+
+def cache_key_of_bytes(data, ruler, tab_size, version):
+    """Same as cache_key of the UTF-8 text in data (any bytes-like object, e.g. mmap)"""
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    h.update(version)
+    h.update('{} {}\n'.format(ruler, tab_size).encode())
+    h.update(data)
+    return h.digest()
+
+
+class ResultCache:
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> None, least recently used first
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        if not data.startswith(MAGIC):
+            return  # Unknown format: start afresh
+
+        data = data[len(MAGIC):]
+        for i in range(0, len(data) - DIGEST_SIZE + 1, DIGEST_SIZE):
+            self.entries[data[i:i + DIGEST_SIZE]] = None
+
+    def __contains__(self, key):
+        if key not in self.entries:
+            return False
+
+        self.entries.move_to_end(key)
+        self.dirty = True
+        return True
+
+    def add(self, key):
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def save(self):
+        """Write the cache atomically.
+
+        Concurrent runs may overwrite each other's updates.
+        """
+        if not self.dirty:
+            return
+
+        folder = os.path.dirname(self.path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC)
+                f.write(b''.join(self.entries))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.dirty = False
@@ -0,0 +1,105 @@
+"""Per-buffer index of line lengths, for finding lines that surpass the ruler.
+
+Line lengths are kept in an array built from a snapshot of the whole text. The
+index is patched in place when typing changes only the lines with cursors, and
+rebuilt lazily otherwise. Queries run over the array with C-level iteration
+(map/compress), so they stay cheap on files with tens of thousands of lines. The
+ruler is a parameter of queries, so views into the same buffer share the index.
+"""
+import sublime
+
+from array import array
+from itertools import compress
+from itertools import count
+from itertools import islice
+
+
+# Commands that only modify the lines the cursors are on (unless they add or remove
+# lines, which is detected by the line count)
+LINE_LOCAL_COMMANDS = {'insert', 'left_delete', 'right_delete', 'delete_word'}
+
+
+class RulerIndex:
+    def __init__(self):
+        self.lengths = array('L')
+        self.total = 0  # sum of the lengths, kept up to date as rows are patched
+        self.change_count = None
+
+    def is_fresh(self, view):
+        return self.change_count == view.change_count()
+
+    def build(self, view):
+        text = view.substr(sublime.Region(0, view.size()))
+        self.lengths = array('L', map(len, text.split('\n')))
+        self.total = sum(self.lengths)
+        self.change_count = view.change_count()
+
+    def ensure_fresh(self, view):
+        if not self.is_fresh(view):
+            self.build(view)
+
+    def note_modified(self, view, was_fresh):
+        """Patch the index after a modification, if it was fresh right before it"""
+        cmd, args, repeat = view.command_history(0)
+        nrows = view.rowcol(view.size())[0] + 1
+
+        if not was_fresh or cmd not in LINE_LOCAL_COMMANDS or nrows != len(self.lengths):
+            self.change_count = None
+            return
+
+        for reg in view.sel():
+            row, col = view.rowcol(view.line(reg.b).end())
+            self.total += col - self.lengths[row]
+            self.lengths[row] = col
+
+        # The modification may have come from another view into the buffer, with its
+        # own cursors. Then the total size most likely doesn't add up.
+        if self.total + len(self.lengths) - 1 != view.size():
+            self.change_count = None
+            return
+
+        self.change_count = view.change_count()
+
+    def violations(self, ruler):
+        """All rows longer than ruler"""
+        return list(compress(count(), map(ruler.__lt__, self.lengths)))
+
+    def count_violations(self, ruler):
+        return sum(map(ruler.__lt__, self.lengths))
+
+    def next_violation(self, row, ruler):
+        """First row after the given one that is longer than ruler, or None"""
+        tail = islice(self.lengths, row + 1, None)
+        return next(compress(count(row + 1), map(ruler.__lt__, tail)), None)
+
+    def prev_violation(self, row, ruler):
+        """Last row before the given one that is longer than ruler, or None"""
+        head = reversed(self.lengths[:max(row, 0)])
+        return next(compress(count(row - 1, -1), map(ruler.__lt__, head)), None)
+
+
+indices = {}  # view.buffer_id() -> RulerIndex
+
+
+def index_for(view):
+    """Get an up-to-date ruler index for the view"""
+    index = indices.get(view.buffer_id())
+    if index is None:
+        index = indices[view.buffer_id()] = RulerIndex()
+
+    index.ensure_fresh(view)
+    return index
+
+
+def note_modified(view, prev_change_count):
+    """Keep the view's index (if any) in sync with a modification.
+
+    :param prev_change_count: change count the previous modification left the view in
+    """
+    index = indices.get(view.buffer_id())
+    if index is not None:
+        index.note_modified(view, index.change_count == prev_change_count)
+
+
+def forget(view):
+    indices.pop(view.buffer_id(), None)
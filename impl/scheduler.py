@@ -0,0 +1,214 @@
+"""Plugin-wide scheduler of deferred work.
+
+Arrows, plans, the violation count, deferred splits and memory accounting are its jobs.
+
+Jobs are keyed by view and name, and scheduling a job again replaces the pending
+one: this is how debouncing works. A job is bound to the change count of its view at
+scheduling time, and is dropped if the view changes before the job is done, since
+its result would be stale.
+
+Due jobs run from a single timer: the active view's jobs first, then by priority.
+A run stops after SLICE_MS and resumes on the next timer tick, so that the UI thread
+is not held for long. A job function may return a generator, which is then resumed
+step by step across slices until exhausted.
+
+Unless given explicitly, the debounce delay adapts: it's longer while typing fast
+(so that jobs wait for a pause) and for jobs that have been measured to be costly.
+"""
+import math
+import sublime
+import time
+
+from types import GeneratorType
+
+
+# Job priorities, lower ones run first
+PRIORITY_SPLIT = 0
+PRIORITY_ARROWS = 1
+PRIORITY_PLANS = 2
+PRIORITY_INDEX = 3
+PRIORITY_MEMORY = 4
+
+SLICE_MS = 4
+
+MIN_DELAY_MS = 50
+MAX_DELAY_MS = 1000
+COST_FACTOR = 10  # jobs wait this many times as long as they typically take
+CADENCE_FACTOR = 1.5  # ... and this many times the typical interval between keystrokes
+PAUSE_MS = 1000  # longer intervals between keystrokes are pauses, not typing cadence
+EWMA_WEIGHT = 0.3
+
+
+class Job:
+    def __init__(self, view, name, fn, priority, due, change_count):
+        self.view = view
+        self.name = name
+        self.fn = fn
+        self.priority = priority
+        self.due = due
+        self.change_count = change_count  # None if the job survives modifications
+        self.gtor = None  # when fn returned a generator
+        self.cost_ms = 0.0
+
+    @property
+    def key(self):
+        return self.view.id(), self.name
+
+    def is_stale(self):
+        return not self.view.is_valid() or (
+            self.change_count is not None and
+            self.change_count != self.view.change_count()
+        )
+
+    def step(self):
+        """Run the job, or its next step. Return whether it is finished."""
+        if self.gtor is None:
+            res = self.fn()
+            if not isinstance(res, GeneratorType):
+                return True
+            self.gtor = res
+
+        try:
+            next(self.gtor)
+        except StopIteration:
+            return True
+        else:
+            return False
+
+    def close(self):
+        if self.gtor is not None:
+            self.gtor.close()
+
+
+jobs = {}  # (view.id(), name) -> Job
+costs = {}  # job name -> moving average of its total run time, ms
+cadences = {}  # view.id() -> [time of last activity, moving average of intervals, ms]
+wake_time = None  # when the timer is going to run due jobs
+
+
+def ewma(avg, value):
+    return value if avg is None else avg + EWMA_WEIGHT * (value - avg)
+
+
+def note_activity(view):
+    """Register a keystroke or cursor move in view, to track typing cadence"""
+    now = time.perf_counter()
+    entry = cadences.get(view.id())
+    if entry is None:
+        cadences[view.id()] = [now, None]
+        return
+
+    interval_ms = (now - entry[0]) * 1000
+    entry[0] = now
+    if interval_ms < PAUSE_MS:
+        entry[1] = ewma(entry[1], interval_ms)
+
+
+def adaptive_delay_ms(view, name):
+    delay = MIN_DELAY_MS
+
+    cost = costs.get(name)
+    if cost is not None:
+        delay = max(delay, cost * COST_FACTOR)
+
+    entry = cadences.get(view.id())
+    if entry is not None and entry[1] is not None:
+        if (time.perf_counter() - entry[0]) * 1000 < PAUSE_MS:
+            delay = max(delay, entry[1] * CADENCE_FACTOR)
+
+    return min(delay, MAX_DELAY_MS)
+
+
+def schedule(view, name, fn, priority, delay_ms=None, cancel_on_change=True):
+    """Run fn() for view later, replacing the pending job of the same name (if any).
+
+    :param delay_ms: fixed delay; by default it's adaptive
+    :param cancel_on_change: whether to drop the job if the view changes before it runs
+    """
+    if delay_ms is None:
+        delay_ms = adaptive_delay_ms(view, name)
+
+    cancel(view, name)
+    job = Job(
+        view, name, fn, priority,
+        due=time.perf_counter() + delay_ms / 1000,
+        change_count=view.change_count() if cancel_on_change else None
+    )
+    jobs[job.key] = job
+    wake_at(job.due)
+
+
+def cancel(view, name):
+    job = jobs.pop((view.id(), name), None)
+    if job is not None:
+        job.close()
+
+
+def forget(view):
+    for key in [key for key in jobs if key[0] == view.id()]:
+        jobs.pop(key).close()
+    cadences.pop(view.id(), None)
+
+
+def wake_at(when):
+    global wake_time
+
+    if wake_time is not None and wake_time <= when:
+        return
+
+    wake_time = when
+    # Round up, or we'd be woken up a fraction of a millisecond too early
+    delay_ms = max(0, math.ceil((when - time.perf_counter()) * 1000))
+    sublime.set_timeout(run_due_jobs, delay_ms)
+
+
+def run_due_jobs():
+    global wake_time
+    wake_time = None
+
+    start = time.perf_counter()
+    active_view_id = get_active_view_id()
+
+    try:
+        while time.perf_counter() - start < SLICE_MS / 1000:
+            due = [job for job in jobs.values() if job.due <= start]
+            if not due:
+                break
+
+            job = min(
+                due,
+                key=lambda job: (job.view.id() != active_view_id, job.priority, job.due)
+            )
+            run_step(job)
+    finally:
+        # If the slice is over, due jobs remain and we resume on the next tick
+        if jobs:
+            wake_at(min(job.due for job in jobs.values()))
+
+
+def run_step(job):
+    if job.is_stale():
+        drop(job)
+        return
+
+    step_start = time.perf_counter()
+    finished = True
+    try:
+        finished = job.step()
+    finally:
+        job.cost_ms += (time.perf_counter() - step_start) * 1000
+        if finished:
+            drop(job)
+            costs[job.name] = ewma(costs.get(job.name), job.cost_ms)
+
+
+def drop(job):
+    if jobs.get(job.key) is job:
+        del jobs[job.key]
+    job.close()
+
+
+def get_active_view_id():
+    window = sublime.active_window()
+    view = window and window.active_view()
+    return view and view.id()
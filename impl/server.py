@@ -0,0 +1,283 @@
+"""Serving the split/join engine to other editors and tools over JSON-RPC.
+
+    python -m AutoSplit.impl.server
+
+Requests and responses are JSON-RPC 2.0 messages, one per line on stdin/stdout. The
+server holds open documents, each a headless.View, so that parse caches stay warm
+between requests and clients send only the edits they make:
+
+    open {uri, text, ruler, tab_size}       -> null
+    change {uri, edits: [{begin, end, text}], ruler?, tab_size?} -> null
+    close {uri}                              -> null
+    split, join, join_to_fit, split_if_too_long {uri, positions}
+                                             -> {edits, cursors}
+    join_spec {uri, position}                -> null or {open, close, row, full}
+    too_long_lines {uri}                     -> [row, ...]
+    shutdown                                 -> null, then the server exits
+
+Positions are character offsets. The edits returned by the commands are already
+applied to the server's copy of the document; the client applies them to its own.
+"""
+from . import headless
+
+import inspect
+import json
+import os
+import subprocess
+import sublime
+import sys
+
+from . import memory
+from . import op
+from . import ruler_index
+from .edit import call_with_edit
+from .edit import forget as forget_edit_state
+from .headless.view import View
+from .recorder import text_diff
+from .shared import cxt
+
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+# Folder containing the plugin's package, to run the server from
+PACKAGES_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class Server:
+    def __init__(self):
+        self.documents = {}  # uri -> View
+        self.running = True
+
+    def handle_line(self, line):
+        """Handle one message, return the response line (None for notifications)"""
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            return json.dumps(error_response(None, PARSE_ERROR, str(e)))
+
+        if not isinstance(message, dict) or not isinstance(message.get('method'), str):
+            return json.dumps(
+                error_response(None, INVALID_REQUEST, "not a JSON-RPC request")
+            )
+
+        msgid = message.get('id')
+        try:
+            result = self.dispatch(message['method'], message.get('params') or {})
+        except RpcError as e:
+            response = error_response(msgid, e.code, str(e))
+        except Exception as e:
+            response = error_response(
+                msgid, INTERNAL_ERROR, "{}: {}".format(type(e).__name__, e)
+            )
+        else:
+            response = {'jsonrpc': '2.0', 'id': msgid, 'result': result}
+
+        # Notifications get no response, even if they fail
+        return json.dumps(response) if 'id' in message else None
+
+    def dispatch(self, method, params):
+        handler = METHODS.get(method)
+        if handler is None:
+            raise RpcError(METHOD_NOT_FOUND, "unknown method: {}".format(method))
+
+        if not isinstance(params, dict):
+            raise RpcError(INVALID_PARAMS, "params must be an object")
+
+        try:
+            inspect.signature(handler).bind(self, **params)
+        except TypeError as e:
+            raise RpcError(INVALID_PARAMS, str(e))
+
+        return handler(self, **params)
+
+    def document(self, uri):
+        view = self.documents.get(uri)
+        if view is None:
+            raise RpcError(INVALID_PARAMS, "document is not open: {}".format(uri))
+        return view
+
+    def serve(self, input, output):
+        for line in input:
+            if not line.strip():
+                continue
+
+            response = self.handle_line(line)
+            if response is not None:
+                output.write(response + '\n')
+                output.flush()
+
+            if not self.running:
+                break
+
+
+def open_document(server, uri, text, ruler=None, tab_size=4):
+    server.documents[uri] = View(text, settings={
+        'rulers': [] if ruler is None else [ruler],
+        'tab_size': tab_size,
+    })
+
+
+def change_document(server, uri, edits=(), ruler=None, tab_size=None):
+    view = server.document(uri)
+
+    def apply(edit):
+        for e in edits:
+            view.replace(edit, sublime.Region(e['begin'], e['end']), e['text'])
+
+    if edits:
+        call_with_edit(view, apply)
+    if ruler is not None:
+        view.settings().set('rulers', [ruler])
+    if tab_size is not None:
+        view.settings().set('tab_size', tab_size)
+
+
+def close_document(server, uri):
+    view = server.documents.pop(uri, None)
+    if view is not None:
+        memory.forget(view)
+        forget_edit_state(view)
+
+
+def command(fn):
+    """Make a method that runs fn(edit, positions) on the document at the positions"""
+    def run(server, uri, positions):
+        view = server.document(uri)
+        old = whole_text(view)
+
+        view.sel().clear()
+        for pos in positions:
+            view.sel().add(pos)
+
+        with cxt.working_on(view):
+            call_with_edit(view, lambda edit: fn(edit, positions))
+
+        new = whole_text(view)
+        begin, end, new_end = text_diff(old, new)
+        return {
+            'edits': [] if old == new else [
+                {'begin': begin, 'end': end, 'text': new[begin:new_end]}
+            ],
+            'cursors': [reg.b for reg in view.sel()],
+        }
+
+    return run
+
+
+def split_if_too_long(edit, positions):
+    if cxt.ruler is not None:
+        op.split_all_if_too_long(edit, positions)
+
+
+def join_spec(server, uri, position):
+    view = server.document(uri)
+
+    with cxt.working_on(view):
+        spec = op.what_to_join_at(position)
+
+    if spec is None:
+        return None
+
+    arglist, row, full = spec
+    return {'open': arglist.open, 'close': arglist.close, 'row': row, 'full': full}
+
+
+def too_long_lines(server, uri):
+    view = server.document(uri)
+
+    with cxt.working_on(view):
+        if cxt.ruler is None:
+            return []
+        return ruler_index.index_for(view).violations(cxt.ruler)
+
+
+def shutdown(server):
+    server.running = False
+
+
+def whole_text(view):
+    return view.substr(sublime.Region(0, view.size()))
+
+
+def error_response(msgid, code, message):
+    return {'jsonrpc': '2.0', 'id': msgid, 'error': {'code': code, 'message': message}}
+
+
+METHODS = {
+    'open': open_document,
+    'change': change_document,
+    'close': close_document,
+    'split': command(op.split_all_at),
+    'join': command(op.join_all_at),
+    'join_to_fit': command(op.join_to_fit_all_at),
+    'split_if_too_long': command(split_if_too_long),
+    'join_spec': join_spec,
+    'too_long_lines': too_long_lines,
+    'shutdown': shutdown,
+}
+
+
+class Client:
+    """Client of a server process, for tests and scripts.
+
+    By default, the server is started with the same interpreter, from the folder
+    containing the plugin's package.
+    """
+
+    def __init__(self, argv=None):
+        self.process = subprocess.Popen(
+            argv or [sys.executable, '-m', __name__],
+            cwd=PACKAGES_DIR,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True
+        )
+        self.next_id = 1
+
+    def request(self, method, **params):
+        """Send a request and wait for its response.
+
+        Return its result, or raise RpcError if it's an error.
+        """
+        msgid = self.next_id
+        self.next_id += 1
+        self.send({'jsonrpc': '2.0', 'id': msgid, 'method': method, 'params': params})
+
+        response = json.loads(self.process.stdout.readline())
+        assert response['id'] == msgid
+
+        if 'error' in response:
+            raise RpcError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def notify(self, method, **params):
+        self.send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    def send(self, message):
+        self.process.stdin.write(json.dumps(message) + '\n')
+        self.process.stdin.flush()
+
+    def close(self):
+        self.request('shutdown')
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+def main():
+    Server().serve(sys.stdin, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Tests of the JSON-RPC server (server.py), driving a server process with its client.
+
+    python -m AutoSplit.impl.server_tests
+
+Each test runs a sequence of requests on one document. The client keeps its own copy
+of the text and applies the edits returned by the server, as an editor would, and the
+result is checked against the expected text.
+"""
+from . import headless
+
+import sys
+
+from .server import Client
+from .server import INVALID_PARAMS
+from .server import METHOD_NOT_FOUND
+from .server import RpcError
+
+
+EDIT_TESTS = [
+    {
+        'name': "Split",
+        'text': "result = function(alpha, beta)\n",
+        'steps': [
+            ('split', {'positions': [20]}),
+        ],
+        'result': "result = function(\n    alpha, beta\n)\n",
+    },
+    {
+        'name': "Join after incremental changes",
+        'text': "result = function(\n    alpha,\n    beta\n)\n",
+        'steps': [
+            ('change', {'edits': [{'begin': 28, 'end': 28, 'text': 'bet'}]}),
+            ('change', {'edits': [{'begin': 0, 'end': 6, 'text': 'output'}]}),
+            ('join', {'positions': [20]}),
+            ('join', {'positions': [20]}),
+        ],
+        'result': "output = function(alphabet, beta)\n",
+    },
+    {
+        'name': "Split a line past the ruler",
+        'text': "result = function(alpha, beta, gamma, delta, epsilon)\n",
+        'ruler': 30,
+        'steps': [
+            ('split_if_too_long', {'positions': [50]}),
+        ],
+        'result': (
+            "result = function(\n"
+            "    alpha,\n    beta,\n    gamma,\n    delta,\n    epsilon\n"
+            ")\n"
+        ),
+    },
+]
+
+
+QUERY_TESTS = [
+    {
+        'name': "Join spec",
+        'text': "result = function(\n    alpha, beta\n)\n",
+        'request': ('join_spec', {'position': 25}),
+        'result': {'open': 18, 'close': 35, 'row': 0, 'full': True},
+    },
+    {
+        'name': "No join spec on a single line",
+        'text': "result = function(alpha, beta)\n",
+        'request': ('join_spec', {'position': 20}),
+        'result': None,
+    },
+    {
+        'name': "Too long lines",
+        'text': "short()\n" + "x = f({})\n".format('a' * 30) + "short()\n" * 2 + "y" * 31,
+        'ruler': 30,
+        'request': ('too_long_lines', {}),
+        'result': [1, 4],
+    },
+]
+
+
+ERROR_TESTS = [
+    {
+        'name': "Unknown method",
+        'request': ('reformat', {'uri': 'doc'}),
+        'code': METHOD_NOT_FOUND,
+    },
+    {
+        'name': "Document not open",
+        'request': ('split', {'uri': 'other', 'positions': [0]}),
+        'code': INVALID_PARAMS,
+    },
+    {
+        'name': "Missing params",
+        'request': ('split', {'uri': 'doc'}),
+        'code': INVALID_PARAMS,
+    },
+]
+
+
+def run_edit_test(client, test):
+    text = test['text']
+    client.request('open', uri='doc', text=text, ruler=test.get('ruler'))
+
+    for method, params in test['steps']:
+        result = client.request(method, uri='doc', **params)
+        edits = params['edits'] if method == 'change' else result['edits']
+        for edit in edits:
+            text = text[:edit['begin']] + edit['text'] + text[edit['end']:]
+
+    client.request('close', uri='doc')
+    return text == test['result']
+
+
+def run_query_test(client, test):
+    client.request('open', uri='doc', text=test['text'], ruler=test.get('ruler'))
+    method, params = test['request']
+    try:
+        return client.request(method, uri='doc', **params) == test['result']
+    finally:
+        client.request('close', uri='doc')
+
+
+def run_error_test(client, test):
+    client.request('open', uri='doc', text="f(x)\n")
+    method, params = test['request']
+    try:
+        client.request(method, **params)
+    except RpcError as e:
+        return e.code == test['code']
+    else:
+        return False
+    finally:
+        client.request('close', uri='doc')
+
+
+def run_tests():
+    client = Client()
+    failed = 0
+
+    try:
+        for tests, run_test in [
+                (EDIT_TESTS, run_edit_test),
+                (QUERY_TESTS, run_query_test),
+                (ERROR_TESTS, run_error_test)]:
+            for test in tests:
+                ok = run_test(client, test)
+                print("# {}: {}".format(test['name'], "SUCCESS" if ok else "FAILURE"))
+                failed += not ok
+    finally:
+        client.close()
+
+    total = len(EDIT_TESTS) + len(QUERY_TESTS) + len(ERROR_TESTS)
+    if failed:
+        print("# FAILURE ({} failed)".format(failed))
+    else:
+        print("# SUCCESS ({} tests passed)".format(total))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_tests())
@@ -1,9 +1,7 @@
 import sublime
-import time
 
 from contextlib import contextmanager
 from functools import partial
-from functools import update_wrapper
 
 
 def ws_span(view, pos):
@@ -140,13 +138,43 @@ def retained_reg(view, reg):
 
 
 def relocating_posns(view, posns):
+    """Yield posns, each relocated by the edits made while the previous ones were used.
+
+    Posns are tracked as hidden regions in blocks of POSNS_PER_KEY, and a block is
+    dropped once used up: getting a position costs the size of its block, not the
+    number of posns, and edits needn't relocate positions already yielded.
+    """
     if len(posns) <= 1:
         yield from posns
         return
 
-    with hidden_regions(view, [sublime.Region(pos) for pos in posns]) as getregs:
-        for i in range(len(posns)):
-            yield getregs()[i].b
+    keys = []
+    try:
+        for i in range(0, len(posns), POSNS_PER_KEY):
+            keys.append(key_acquire())
+            block = posns[i:i + POSNS_PER_KEY]
+            add_hidden_regions(view, keys[-1], [sublime.Region(pos) for pos in block])
+
+        for i, key in enumerate(keys):
+            for k in range(min(POSNS_PER_KEY, len(posns) - i * POSNS_PER_KEY)):
+                yield get_hidden_regions(view, key)[k].b
+            erase_hidden_regions(view, key)
+    finally:
+        for key in keys:
+            erase_hidden_regions(view, key)
+            key_release(key)
+
+
+POSNS_PER_KEY = 64
+
+
+def has_clones(view):
+    """Whether other views into view's buffer are open"""
+    return any(
+        other.buffer_id() == view.buffer_id() and other.id() != view.id()
+        for window in sublime.windows()
+        for other in window.views()
+    )
 
 
 def redo_empty(view):
@@ -162,52 +190,3 @@ def line_ruler_pos(view, pos, ruler):
 def line_too_long(view, pos, ruler):
     return line_ruler_pos(view, pos, ruler) is not None
 
-
-def if_not_called_for(period_ms):
-    def wrapper(fn):
-        idle_func = IdleFunc(fn, period_ms / 1000)
-        update_wrapper(idle_func, fn)
-        return idle_func
-
-    return wrapper
-
-
-class IdleFunc:
-    def __init__(self, fn, interval):
-        self.fn = fn
-        self.interval = interval
-        self.last_called = time.perf_counter()
-        self.args = None
-        self.kwargs = None
-        self.timeout = Timeout(self._timeout_callback)
-
-    def __call__(self, *args, **kwargs):
-        self.last_called = time.perf_counter()
-        self.args = args
-        self.kwargs = kwargs
-        self.timeout.wind(self.interval)
-
-    def _timeout_callback(self):
-        idle_for = time.perf_counter() - self.last_called
-        if idle_for > self.interval:
-            try:
-                self.fn(*self.args, **self.kwargs)
-            finally:
-                self.args = self.kwargs = None
-        else:
-            self.timeout.wind(self.interval - idle_for)
-
-
-class Timeout:
-    def __init__(self, callback):
-        self.callback = callback
-        self.wound = False
-
-    def wind(self, delay):
-        if not self.wound:
-            sublime.set_timeout(self._callback_wrapper, delay)
-            self.wound = True
-
-    def _callback_wrapper(self):
-        self.wound = False
-        self.callback()
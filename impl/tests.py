@@ -1,8 +1,11 @@
 import sublime
 import re
+import time
 
+from contextlib import contextmanager
 from sublime import Region
 
+from .ds import Arglist
 from .edit import call_with_edit
 from .sublime_util import retained_reg
 from .common import method_for
@@ -309,6 +312,27 @@ wrapper1(arg1, arg2, wrapper2(arg21, wrapper3(arg31, arg32, arg|33)))-!
 wrapper1(
     arg1, arg2, wrapper2(arg21, wrapper3(arg31, arg32, arg1234567|33))
 )
+"""
+    },
+
+    {
+        'name': "Split long nested arglists down to the final layout at once",
+        'input': """
+x = wrapper1(arg1, arg2, wrapper2(arg21, wrapper3(arg31, arg32, arg|33)))
+""",
+        'op': 'paste',
+        'to-paste': "1234567",
+        'result': """
+x = wrapper1(--------------------------!
+    arg1,
+    arg2,
+    wrapper2(
+        arg21,
+        wrapper3(
+            arg31, arg32, arg1234567|33
+        )
+    )
+)
 """
     },
 
@@ -568,11 +592,186 @@ outer_func(
     blah, nested(210), fearsome(arg, arg(No|ne))
 )
 """
+    },
+
+    {
+        'name': "Join to row 1 in a return statement",
+        'input': """
+def f():
+    return foo(
+        alpha,
+        be|ta
+    )
+""",
+        'op': 'join',
+        'result': """
+def f():
+    return foo(
+        alpha, be|ta
+    )
+"""
+    },
+
+    {
+        'name': "Join to row 1 in a raise statement",
+        'input': """
+def f():
+    raise Error(
+        alpha,
+        be|ta
+    )
+""",
+        'op': 'join',
+        'result': """
+def f():
+    raise Error(
+        alpha, be|ta
+    )
+"""
+    },
+
+    {
+        'name': "Join to row 1 in an assert statement",
+        'input': """
+def f():
+    assert check(
+        alpha,
+        be|ta
+    ), "message"
+""",
+        'op': 'join',
+        'result': """
+def f():
+    assert check(
+        alpha, be|ta
+    ), "message"
+"""
+    },
+
+    {
+        'name': "Join to row 1 in a with statement",
+        'input': """
+def f():
+    with opened(
+        alpha,
+        be|ta
+    ) as f:
+        pass
+""",
+        'op': 'join',
+        'result': """
+def f():
+    with opened(
+        alpha, be|ta
+    ) as f:
+        pass
+"""
+    },
+
+    {
+        'name': "Join to row 1 in a del statement",
+        'input': """
+def f():
+    del items[index(
+        alpha,
+        be|ta
+    )]
+""",
+        'op': 'join',
+        'result': """
+def f():
+    del items[index(
+        alpha, be|ta
+    )]
+"""
+    },
+
+    {
+        'name': "Join to fit the whole subtree",
+        'input': """
+outer_func(
+    bl|ah,
+    nested(
+        210,
+        220
+    ),
+    fearsome(
+        arg,
+        arg(None)
+    )
+)
+""",
+        'op': 'join-to-fit',
+        'result': """
+outer_func(bl|ah, nested(210, 220), fearsome(arg, arg(None)))
+"""
+    },
+
+    {
+        'name': "Join to fit to row 1",
+        'input': """
+outer_func(
+    bl|ah,
+    nested(
+        210,
+        220
+    ),
+    fearsome(
+        arg,
+        arg(None)
+    )
+)
+""",
+        'op': 'join-to-fit',
+        'result': """
+outer_func(-------------------------------------------!
+    bl|ah, nested(210, 220), fearsome(arg, arg(None))
+)
+"""
+    },
+
+    {
+        'name': "Join to fit nested in a split arglist",
+        'input': """
+outer_func(
+    blah,
+    nested(
+        210,
+        220
+    ),
+    fearsome(
+        arg,
+        a|rg(None)
+    )
+)
+""",
+        'op': 'join-to-fit',
+        'result': """
+outer_func(---------------!
+    blah,
+    nested(
+        210,
+        220
+    ),
+    fearsome(
+        arg, a|rg(None)
+    )
+)
+"""
+    }
+]
+
+
+DEEP_NESTING_TESTS = [
+    {
+        'name': "Join 10,000 levels deep in linear time",
+        'op': 'deep-nesting',
+        'depths': [1000, 10000],
     }
 ]
 
 
-ALL_TESTS = SPLIT_TESTS + SPLIT_IF_TOO_LONG_TESTS + JOIN_TESTS
+ALL_TESTS = SPLIT_TESTS + SPLIT_IF_TOO_LONG_TESTS + JOIN_TESTS + DEEP_NESTING_TESTS
 
 
 class Context:
@@ -632,6 +831,9 @@ def run_tests(self, tests):
 def run_test(self, test):
     self.edit_call(lambda: self.print("# {}\n", test['name']))
 
+    if test['op'] == 'deep-nesting':
+        return self.run_deep_nesting_test(test['depths'])
+
     reg, i_ruler = self.setup_test(test['input'])
     exp_result, exp_cur, r_ruler = parse_text_spec(test['result'])
 
@@ -642,6 +844,8 @@ def run_test(self, test):
             self.view.run_command('autosplit_split')
         elif test['op'] == 'join':
             self.view.run_command('autosplit_join')
+        elif test['op'] == 'join-to-fit':
+            self.view.run_command('autosplit_join_to_fit')
         elif test['op'] == 'paste':
             self.view.run_command('insert', {'characters': test['to-paste']})
         else:
@@ -669,6 +873,86 @@ def run_test(self, test):
         return self.edit_call(print_result)
 
 
+@method_for(Context)
+def run_deep_nesting_test(self, depths):
+    """Join arglists nested 'depths' levels deep, checking results and work growth"""
+    self.setup_ruler(10 ** 9)
+    visits = []
+
+    # Deep arglists exceed the scan budget meant for typing at an unbalanced paren
+    plugin_settings = sublime.load_settings('AutoSplit.sublime-settings')
+    max_scan_tokens = plugin_settings.get('max_scan_tokens')
+    plugin_settings.set('max_scan_tokens', 0)
+    try:
+        return self.check_deep_nesting(depths, visits)
+    finally:
+        plugin_settings.set('max_scan_tokens', max_scan_tokens)
+
+
+@method_for(Context)
+def check_deep_nesting(self, depths, visits):
+    for depth in depths:
+        nested = "f(\n" * depth + "x" + "\n)" * depth
+        joined_to_row1 = "f(\n    " + "f(" * (depth - 1) + "x" + ")" * (depth - 1) + "\n)"
+        joined_fully = "f(" * depth + "x" + ")" * depth
+
+        timing = []
+        counts = []
+        for cmd, expected in [
+                ('autosplit_join', joined_to_row1),
+                ('autosplit_join_to_fit', joined_fully)]:
+            reg, _ = self.setup_test('\n|' + nested + '\n')
+            self.sel.clear()
+            self.sel.add(reg.begin() + 2)
+
+            with retained_reg(self.view, reg) as getreg, arglist_visits() as count:
+                start = time.perf_counter()
+                self.view.run_command(cmd)
+                timing.append(time.perf_counter() - start)
+                counts.append(count())
+                result = self.view.substr(getreg())
+                self.edit_call(lambda: self.view.erase(self.edit, getreg()))
+
+            if result != expected:
+                self.edit_call(
+                    lambda: self.print("# FAILURE: wrong result of {}\n\n", cmd)
+                )
+                return False
+
+        visits.append(counts)
+        self.edit_call(lambda: self.print(
+            "# {} levels: join {:.3f}s ({} arglist visits), join to fit {:.3f}s ({})\n",
+            depth, timing[0], counts[0], timing[1], counts[1]
+        ))
+
+    # Visits per level must not grow with depth (unlike time, they don't depend on load)
+    for (depth0, counts0), (depth, counts) in zip(zip(depths, visits),
+                                                  zip(depths[1:], visits[1:])):
+        if any(n * depth0 > n0 * depth for n0, n in zip(counts0, counts)):
+            self.edit_call(lambda: self.print("# FAILURE: work grows non-linearly\n\n"))
+            return False
+
+    self.edit_call(lambda: self.print('# SUCCESS\n\n'))
+    return True
+
+
+@contextmanager
+def arglist_visits():
+    """Count reads of Arglist.args in the context, i.e. arglists visited by the engine"""
+    count = [0]
+    args = Arglist.args
+
+    def counted(arglist):
+        count[0] += 1
+        return args.fget(arglist)
+
+    Arglist.args = property(counted)
+    try:
+        yield lambda: count[0]
+    finally:
+        Arglist.args = args
+
+
 @method_for(Context)
 def setup_ruler(self, ruler):
     self.settings.set('rulers', None if ruler is None else [ruler])
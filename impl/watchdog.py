@@ -0,0 +1,84 @@
+"""Turning off automatic features in views where they are too slow.
+
+Every listener invocation the user waits on is timed (speculative background work is
+not). Once a view exceeds the latency budget several
+times in a row, it is degraded: no arrows, no auto-split (explicit commands still
+work). Features come back when the file shrinks substantially or when the user runs
+autosplit_restore_features.
+"""
+import sublime
+import time
+
+from contextlib import contextmanager
+
+
+STATUS_KEY = 'autosplit'
+STATUS_DEGRADED = 'AutoSplit: slow file, auto-split and arrows are off'
+
+# The view is restored if it shrinks below this fraction of its size at degradation
+SHRINK_RATIO = 0.5
+
+
+class Health:
+    def __init__(self):
+        self.strikes = 0  # consecutive invocations over the budget
+        self.degraded_at_size = None
+
+
+health = {}  # view.id() -> Health
+
+
+def health_of(view):
+    return health.setdefault(view.id(), Health())
+
+
+def is_degraded(view):
+    h = health.get(view.id())
+    if h is None or h.degraded_at_size is None:
+        return False
+
+    if view.size() < h.degraded_at_size * SHRINK_RATIO:
+        restore(view)
+        return False
+
+    return True
+
+
+@contextmanager
+def timed(view):
+    """Time a listener invocation and degrade the view if it's repeatedly too slow"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(view, (time.perf_counter() - start) * 1000)
+
+
+def record(view, elapsed_ms):
+    settings = sublime.load_settings('AutoSplit.sublime-settings')
+    budget_ms = settings.get('latency_budget_ms')
+    if not budget_ms:
+        return
+
+    h = health_of(view)
+    if elapsed_ms <= budget_ms:
+        h.strikes = 0
+        return
+
+    h.strikes += 1
+    if h.strikes >= settings.get('latency_strikes', 3) and h.degraded_at_size is None:
+        degrade(view)
+
+
+def degrade(view):
+    health_of(view).degraded_at_size = view.size()
+    view.set_status(STATUS_KEY, STATUS_DEGRADED)
+
+
+def restore(view):
+    health[view.id()] = Health()
+    view.erase_status(STATUS_KEY)
+
+
+def forget(view):
+    health.pop(view.id(), None)